@@ -1,3 +1,4 @@
 #!/bin/sh
 
-exec python -m parliament "$(dirname "$0")"
+cd "$(dirname "$0")"
+exec gunicorn -c gunicorn.conf.py wsgi:app
@@ -0,0 +1,91 @@
+"""
+Load generator for a running langflow-runtime, to compare serving modes
+(`python -m parliament .` against `gunicorn -c gunicorn.conf.py wsgi:app`):
+
+    python benchmark.py --flow "DPN SQL flow" --input "list the tables" -c 8 -n 200
+    python benchmark.py --url http://localhost:8080/health/readiness -c 32 -n 5000
+
+Prints throughput, goodput, latency percentiles and the status codes received.
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_request(url: str, flow: str, text: str) -> urllib.request.Request:
+    if not flow:
+        return urllib.request.Request(url, method="GET")
+    body = json.dumps({"name": flow, "inputs": {"input": text}}).encode()
+    headers = {
+        "Ce-Id": str(uuid.uuid4()),
+        "Ce-Source": "langflow-runtime-benchmark",
+        "Ce-Specversion": "1.0",
+        "Ce-Type": "io.hitachivantara.langflow.execute.v1",
+        "Content-Type": "application/json",
+    }
+    return urllib.request.Request(url, data=body, headers=headers, method="POST")
+
+
+def send(url: str, flow: str, text: str, timeout: float):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(build_request(url, flow, text), timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - started
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(url: str, flow: str, text: str, concurrency: int, requests: int, timeout: float) -> dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send(url, flow, text, timeout), range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for _, latency in results]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 2),
+        # Requests answered successfully per second
+        "goodput": round(sum(1 for status, _ in results if status == 200) / elapsed, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "status": dict(Counter(str(status) for status, _ in results)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080/")
+    parser.add_argument("--flow", default="", help="flow to run, GET the url when empty")
+    parser.add_argument("--input", default="", help="input text of the flow")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent before measuring")
+    args = parser.parse_args()
+
+    if args.warmup:
+        run(args.url, args.flow, args.input, args.concurrency, args.warmup, args.timeout)
+    print(json.dumps(run(args.url, args.flow, args.input, args.concurrency, args.requests, args.timeout), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Create the side tables of the flow execution plans (`flow_plan` and
+`flow_component_code`) in the langflow database. A deployment step, run once
+with the DATABASE_URI of the runtime and a role allowed to create tables:
+
+    python create_flow_plan_tables.py
+
+Until they exist the runtime runs the flows from their editor documents.
+"""
+import sys
+
+import func
+
+
+def main() -> int:
+    db = func.get_database()
+    if db.plans is None:
+        print("FLOW_PLANS is disabled, no tables to create")
+        return 0
+    db.plans.create_tables()
+    print("Flow plan tables created")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,15 @@
-from langchain.agents import AgentExecutor, create_structured_chat_agent
+from langchain.agents import AgentExecutor
+from custom_components.custom_langchain_components.concurrent_agent_executor import ConcurrentAgentExecutor
 #from langchain_wrapper import SeldonCore
 from langchain.chains.conversation.memory import ConversationBufferWindowMemory
 from langflow import CustomComponent
 from langchain.tools import BaseTool
 
-from custom_components.custom_langchain_components.dpn_bucket_tool import sys_msg, human_msg, ListDpnBucketContentTool, SqlTool
+from custom_components.custom_langchain_components.dpn_bucket_tool import build_human_msg, build_sys_msg, ListDpnBucketContentTool, SqlTool
+from custom_components.custom_langchain_components.compiled_prompt import family_of
 from langchain.llms import BaseLLM
-import langchain.hub as hub
+from custom_components.custom_langchain_components.prompt_registry import get_chat_prompt
+from custom_components.custom_langchain_components.json_agent_output_parser import create_structured_chat_agent
 from typing import Union, Optional, List
 from langflow.field_typing import BaseLanguageModel, BaseMemory, Chain
 # special tokens used by llama 2 chat
@@ -37,11 +40,12 @@ class CustomAgentComponent(CustomComponent):
         
         # tools = [ListDpnBucketContentTool(), SqlTool()]
         
-        prompt = hub.pull("coty/react-chat-json-v1")
-        print(f"Prompt:\n {prompt}\n")
-
-        prompt.messages[0].prompt.template = sys_msg
-        prompt.messages[1].prompt.template = human_msg
+        # List the DPN tables from the schema snapshot in the system prompt
+        table_info = "\n".join(tool.table_info() for tool in tools if isinstance(tool, SqlTool))
+        # Written in the special tokens of the model family of the LLM (or PROMPT_MODEL_FAMILY)
+        family = family_of(llm)
+        # Resolved from the prompts shipped with the runtime, no hub round trip
+        prompt = get_chat_prompt("coty/react-chat-json-v1", (build_sys_msg(table_info, family), build_human_msg(family)))
         # conversational_memory = ConversationBufferWindowMemory(
         #         memory_key='history',
         #         k=5,
@@ -49,8 +53,11 @@ class CustomAgentComponent(CustomComponent):
         #         # input_key="input"
         # )
 
+        # Malformed JSON is repaired locally, only unrecoverable output is re-prompted
         agent = create_structured_chat_agent(llm, tools, prompt=prompt)
 
-        executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, memory=memory)
+        # Independent actions of one step run concurrently. The executor stops
+        # with the last observation as a partial answer at the request deadline.
+        executor = ConcurrentAgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, memory=memory)
         executor.input_keys.append('chat_history')
         return executor
\ No newline at end of file
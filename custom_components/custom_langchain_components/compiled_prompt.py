@@ -0,0 +1,282 @@
+import math
+import os
+import re
+import string
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Conservative for llama2/zephyr tokenizers, which average about 4 characters per token in English
+DEFAULT_CHARS_PER_TOKEN = 3.5
+# Characters of text whose tokenizer counts are memoized
+DEFAULT_COUNT_CACHE_CHARS = 1 << 20
+# Separator of the steps in an agent scratchpad rendered by format_log_to_str:
+# each step is its action log and observation followed by "\nThought: ".
+SCRATCHPAD_STEP_SEPARATOR = "\nThought: "
+# Dynamic slots shortened when a prompt is over budget, in this order, which
+# end of them is kept and the separator of the units dropped: the latest turns
+# of the history, the latest steps of the agent scratchpad and the first (most
+# relevant) sections of the context.
+DEFAULT_TRIM_SLOTS = (
+    ("history", "end", "\n"),
+    ("chat_history", "end", "\n"),
+    ("agent_scratchpad", "end", SCRATCHPAD_STEP_SEPARATOR),
+    ("context", "start", "\n"),
+)
+
+
+@dataclass(frozen=True)
+class ModelFamily:
+    """Special tokens a model family wraps instructions and chat turns with."""
+
+    name: str
+    bos: str = ""
+    eos: str = ""
+    inst_start: str = ""
+    inst_end: str = ""
+    sys_start: str = ""
+    sys_end: str = ""
+    human_suffix: str = ""
+    ai_suffix: str = ""
+
+
+LLAMA2 = ModelFamily(
+    "llama2", bos="<s>", eos="</s>", inst_start="[INST]", inst_end="[/INST]",
+    sys_start="<<SYS>>\n", sys_end="\n<</SYS>>\n\n",
+    human_suffix=" [/INST]", ai_suffix=" </s><s>[INST]",
+)
+ZEPHYR = ModelFamily("zephyr")
+MODEL_FAMILIES: Dict[str, ModelFamily] = {family.name: family for family in (LLAMA2, ZEPHYR)}
+
+
+def model_family(name: str) -> ModelFamily:
+    return MODEL_FAMILIES.get(name, ZEPHYR)
+
+
+def family_of(llm=None) -> ModelFamily:
+    """
+    Model family prompts for `llm` are written for: PROMPT_MODEL_FAMILY when
+    set, otherwise the family named in the model of the LLM (e.g. the
+    `repo_id` "llama2-chat" of SeldonCore).
+    """
+    name = os.getenv("PROMPT_MODEL_FAMILY", "")
+    if not name and llm is not None:
+        model = next((value for value in (getattr(llm, attr, None) for attr in ("repo_id", "model_name", "model", "model_id"))
+                      if isinstance(value, str)), "")
+        name = next((family for family in MODEL_FAMILIES if family in model.lower()), "")
+    return model_family(name)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with the tokenizer named by PROMPT_TOKENIZER when the
+    optional `tokenizers` package is installed, and estimates them from the
+    length of the text otherwise. Tokenizer counts are memoized, least
+    recently used first out above `cache_chars` characters of text, so the
+    turns of a history are encoded once.
+    """
+
+    def __init__(self, tokenizer: Optional[str] = None, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN,
+                 cache_chars: int = DEFAULT_COUNT_CACHE_CHARS):
+        self.chars_per_token = chars_per_token
+        self.cache_chars = cache_chars
+        self._tokenizer = None
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._cached_chars = 0
+        self._lock = threading.Lock()
+        if tokenizer:
+            try:
+                from tokenizers import Tokenizer
+
+                self._tokenizer = (Tokenizer.from_file(tokenizer) if os.path.isfile(tokenizer)
+                                   else Tokenizer.from_pretrained(tokenizer))
+            except Exception as e:
+                logger.warning(f"Estimating token counts, tokenizer {tokenizer} unavailable: {type(e).__name__} - {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is None:
+            return math.ceil(len(text) / self.chars_per_token)
+        with self._lock:
+            tokens = self._counts.get(text)
+            if tokens is not None:
+                self._counts.move_to_end(text)
+                return tokens
+        tokens = len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        # Whole rendered prompts would flush the cache, only parts of them are kept
+        if len(text) <= self.cache_chars // 16:
+            with self._lock:
+                if text not in self._counts:
+                    self._counts[text] = tokens
+                    self._cached_chars += len(text)
+                    while self._cached_chars > self.cache_chars:
+                        evicted, _ = self._counts.popitem(last=False)
+                        self._cached_chars -= len(evicted)
+        return tokens
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter(
+                    tokenizer=os.getenv("PROMPT_TOKENIZER"),
+                    chars_per_token=float(os.getenv("PROMPT_CHARS_PER_TOKEN", DEFAULT_CHARS_PER_TOKEN)),
+                )
+    return _counter
+
+
+def default_token_budget() -> int:
+    """PROMPT_TOKEN_BUDGET, 0 meaning unlimited."""
+    return int(os.getenv("PROMPT_TOKEN_BUDGET", 0))
+
+
+_metrics = {"renders": 0, "trimmed": 0, "trimmed_tokens": 0, "over_budget": 0}
+_metrics_lock = threading.Lock()
+
+
+def get_prompt_metrics() -> Dict[str, int]:
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+def _count_metric(**increments: int):
+    with _metrics_lock:
+        for name, value in increments.items():
+            _metrics[name] += value
+
+
+def trim_to_tokens(text: str, max_tokens: int, keep: str = "end", counter: Optional[TokenCounter] = None,
+                   sep: str = "\n") -> str:
+    """
+    Shorten `text` to at most `max_tokens`, dropping whole lines (or units
+    separated by `sep`) from the start (keep="end") or from the end
+    (keep="start") first.
+    """
+    counter = counter or get_token_counter()
+    if counter.count(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    lines = text.split(sep)
+    ordered = reversed(lines) if keep == "end" else lines
+    sep_tokens = counter.count(sep)
+    kept: List[str] = []
+    used = 0
+    for line in ordered:
+        # Plus the separator joining it to the lines kept so far
+        tokens = counter.count(line) + (sep_tokens if kept else 0)
+        if used + tokens > max_tokens:
+            if not kept:
+                # A single line over budget, keep the characters that fit
+                chars = int(max_tokens * counter.chars_per_token)
+                kept.append(line[-chars:] if keep == "end" else line[:chars])
+            break
+        kept.append(line)
+        used += tokens
+    if keep == "end":
+        kept.reverse()
+    return sep.join(kept)
+
+
+_Slot = Tuple[str, str]
+
+
+class CompiledTemplate:
+    """
+    A str.format template split once into literal segments and slots. The
+    fields bound in `static` (system prompt, model tags, ...) are rendered
+    into the literal segments and counted once at compile time, rendering
+    only substitutes the dynamic slots and counts their values.
+    """
+
+    def __init__(self, template: str, static: Optional[Dict[str, str]] = None,
+                 counter: Optional[TokenCounter] = None):
+        self.template = template
+        self.counter = counter or get_token_counter()
+        static = static or {}
+        segments: List[Union[str, _Slot]] = []
+        literal: List[str] = []
+        for text, field, spec, conversion in string.Formatter().parse(template):
+            literal.append(text)
+            if field is None:
+                continue
+            name = re.split(r"[.\[]", field, 1)[0]
+            if not name:
+                raise ValueError(f"Positional fields are not supported in prompt templates: {template[:80]!r}")
+            replacement = "{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}"
+            if name in static:
+                literal.append(replacement.format(**static))
+                continue
+            segments.append("".join(literal))
+            literal = []
+            segments.append((name, replacement))
+        segments.append("".join(literal))
+        self._segments = [s for s in segments if s != ""]
+        self.slots = tuple(dict.fromkeys(s[0] for s in self._segments if isinstance(s, tuple)))
+        self.static_tokens = sum(self.counter.count(s) for s in self._segments if isinstance(s, str))
+
+    def _substitute(self, values: Dict[str, str]) -> str:
+        parts = []
+        for segment in self._segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+            else:
+                name, replacement = segment
+                value = values[name]
+                parts.append(value if replacement == "{" + name + "}" and isinstance(value, str)
+                             else replacement.format(**{name: value}))
+        return "".join(parts)
+
+    def count(self, values: Dict[str, object]) -> int:
+        """Tokens of the prompt rendered with `values`."""
+        return self.static_tokens + sum(self.counter.count(str(values[name])) for name in self.slots)
+
+    def render(self, budget: int = 0, trim: Sequence[Tuple[str, str, str]] = DEFAULT_TRIM_SLOTS, **values) -> str:
+        """
+        Render with the dynamic `values`. Above `budget` tokens (0 for no
+        budget) the `trim` slots are shortened, in order, until it fits.
+        """
+        _count_metric(renders=1)
+        if budget > 0:
+            total = self.count(values)
+            if total > budget:
+                over = total - budget
+                trimmed = 0
+                for name, keep, sep in trim:
+                    if over <= 0:
+                        break
+                    if name not in self.slots or not isinstance(values.get(name), str):
+                        continue
+                    tokens = self.counter.count(values[name])
+                    values[name] = trim_to_tokens(values[name], max(0, tokens - over), keep, self.counter, sep)
+                    saved = tokens - self.counter.count(values[name])
+                    over -= saved
+                    trimmed += saved
+                _count_metric(trimmed=1, trimmed_tokens=trimmed)
+                if over > 0:
+                    _count_metric(over_budget=1)
+                    logger.warning(f"Prompt is {over} tokens over its budget of {budget} after trimming")
+        return self._substitute(values)
+
+
+@lru_cache(maxsize=256)
+def _compile(template: str, static: Tuple[Tuple[str, str], ...]) -> CompiledTemplate:
+    return CompiledTemplate(template, dict(static))
+
+
+def compile_template(template: str, **static: str) -> CompiledTemplate:
+    """Shared CompiledTemplate of `template` with the `static` fields pre-rendered."""
+    return _compile(template, tuple(sorted(static.items())))
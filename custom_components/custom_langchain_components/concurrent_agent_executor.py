@@ -0,0 +1,218 @@
+import contextvars
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain.agents import AgentExecutor
+from langchain.agents.agent import ExceptionTool
+from langchain.agents.tools import InvalidTool
+from langchain.callbacks.manager import CallbackManagerForChainRun
+from langchain.tools import BaseTool
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.exceptions import OutputParserException
+
+from custom_components.logger import setup_logger
+from custom_components.runtime.deadline import DeadlineExceeded, current_deadline, remaining_timeout
+
+logger = setup_logger(__name__)
+
+DEFAULT_TOOL_CONCURRENCY = 4
+# Observation of a tool call cut short by the request deadline
+TIMED_OUT_OBSERVATION = "The request ran out of time before the tool call completed."
+NO_ANSWER = "The request ran out of time before an answer was found."
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_tool_pool() -> ThreadPoolExecutor:
+    """Process-wide pool running agent tool calls, sized by AGENT_TOOL_CONCURRENCY."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("AGENT_TOOL_CONCURRENCY", DEFAULT_TOOL_CONCURRENCY)),
+                    thread_name_prefix="agent-tool",
+                )
+    return _pool
+
+
+def action_key(action: AgentAction) -> Tuple[str, str]:
+    return action.tool, json.dumps(action.tool_input, sort_keys=True, default=str)
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs all the actions the agent returns for one step
+    concurrently on a bounded pool and feeds the observations back together.
+
+    An action identical to one already run earlier in the same execution is
+    answered from its previous observation instead of calling the tool again.
+
+    Once the request deadline is reached the agent stops and answers with the
+    last observation it got, marking the deadline as stopped early. A tool
+    call still running at the deadline is not waited for, its observation is
+    TIMED_OUT_OBSERVATION.
+    """
+
+    def _iter_next_step(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        inputs: Dict[str, str],
+        intermediate_steps: List[Tuple[AgentAction, str]],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            yield self._deadline_finish(intermediate_steps)
+            return
+        try:
+            # Call the LLM to see what to do.
+            output = self.agent.plan(
+                self._prepare_intermediate_steps(intermediate_steps),
+                callbacks=run_manager.get_child() if run_manager else None,
+                **inputs,
+            )
+        except OutputParserException as e:
+            yield self._parsing_error_step(e, run_manager)
+            return
+        except DeadlineExceeded:
+            yield self._deadline_finish(intermediate_steps)
+            return
+
+        # If the tool chosen is the finishing tool, then we end and return.
+        if isinstance(output, AgentFinish):
+            yield output
+            return
+
+        actions: List[AgentAction] = [output] if isinstance(output, AgentAction) else output
+        for agent_action in actions:
+            yield agent_action
+
+        observations = {
+            action_key(action): observation
+            for action, observation in intermediate_steps
+            if action.tool in name_to_tool_map
+        }
+        to_run: List[AgentAction] = []
+        for agent_action in actions:
+            if run_manager:
+                run_manager.on_agent_action(agent_action, color="green")
+            key = action_key(agent_action)
+            if key in observations:
+                logger.debug(f"Reusing observation of {agent_action.tool} for {agent_action.tool_input!r}")
+            elif key not in {action_key(a) for a in to_run}:
+                to_run.append(agent_action)
+
+        if len(to_run) == 1 and deadline is None:
+            action = to_run[0]
+            observations[action_key(action)] = self._run_action(action, name_to_tool_map, color_mapping, run_manager)
+        elif to_run:
+            # Copy the context so the request deadline applies in the pool threads too.
+            # Under a deadline even a single call runs there so that it can be abandoned.
+            pool = get_tool_pool()
+            futures = [
+                (action, pool.submit(contextvars.copy_context().run, self._run_action,
+                                     action, name_to_tool_map, color_mapping, run_manager))
+                for action in to_run
+            ]
+            for action, future in futures:
+                try:
+                    # A tool ignoring the deadline does not hold up the answer
+                    observation = future.result(timeout=remaining_timeout())
+                except TimeoutError:
+                    if future.done():
+                        observation = future.result()
+                    else:
+                        logger.warning(f"{action.tool} did not complete before the deadline")
+                        observation = TIMED_OUT_OBSERVATION
+                observations[action_key(action)] = observation
+
+        for agent_action in actions:
+            yield AgentStep(action=agent_action, observation=observations[action_key(agent_action)])
+
+    @staticmethod
+    def _deadline_finish(intermediate_steps: List[Tuple[AgentAction, str]]) -> AgentFinish:
+        """Answer with the last observation the agent got before the deadline."""
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.stopped_early = True
+        for action, observation in reversed(intermediate_steps):
+            if action.tool != "_Exception" and observation != TIMED_OUT_OBSERVATION:
+                logger.info(f"Deadline reached, answering with the last observation of {action.tool}")
+                return AgentFinish({"output": str(observation)}, "")
+        return AgentFinish({"output": NO_ANSWER}, "")
+
+    def _parsing_error_step(self, e: OutputParserException,
+                            run_manager: Optional[CallbackManagerForChainRun]) -> AgentStep:
+        """Turn an output parsing error into an observation, as AgentExecutor does."""
+        if isinstance(self.handle_parsing_errors, bool):
+            raise_error = not self.handle_parsing_errors
+        else:
+            raise_error = False
+        if raise_error:
+            raise ValueError(
+                "An output parsing error occurred. "
+                "In order to pass this error back to the agent and have it try "
+                "again, pass `handle_parsing_errors=True` to the AgentExecutor. "
+                f"This is the error: {str(e)}"
+            )
+        text = str(e)
+        if isinstance(self.handle_parsing_errors, bool):
+            if e.send_to_llm:
+                observation = str(e.observation)
+                text = str(e.llm_output)
+            else:
+                observation = "Invalid or incomplete response"
+        elif isinstance(self.handle_parsing_errors, str):
+            observation = self.handle_parsing_errors
+        elif callable(self.handle_parsing_errors):
+            observation = self.handle_parsing_errors(e)
+        else:
+            raise ValueError("Got unexpected type of `handle_parsing_errors`")
+        output = AgentAction("_Exception", observation, text)
+        if run_manager:
+            run_manager.on_agent_action(output, color="green")
+        tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+        observation = ExceptionTool().run(
+            output.tool_input,
+            verbose=self.verbose,
+            color=None,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **tool_run_kwargs,
+        )
+        return AgentStep(action=output, observation=observation)
+
+    def _run_action(self, agent_action: AgentAction, name_to_tool_map: Dict[str, BaseTool],
+                    color_mapping: Dict[str, str], run_manager: Optional[CallbackManagerForChainRun]):
+        tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+        if agent_action.tool not in name_to_tool_map:
+            return InvalidTool().run(
+                {
+                    "requested_tool_name": agent_action.tool,
+                    "available_tool_names": list(name_to_tool_map.keys()),
+                },
+                verbose=self.verbose,
+                color=None,
+                callbacks=run_manager.get_child() if run_manager else None,
+                **tool_run_kwargs,
+            )
+        tool = name_to_tool_map[agent_action.tool]
+        if tool.return_direct:
+            tool_run_kwargs["llm_prefix"] = ""
+        # We then call the tool on the tool input to get an observation
+        try:
+            return tool.run(
+                agent_action.tool_input,
+                verbose=self.verbose,
+                color=color_mapping[agent_action.tool],
+                callbacks=run_manager.get_child() if run_manager else None,
+                **tool_run_kwargs,
+            )
+        except DeadlineExceeded:
+            # The next step answers with what the other calls returned
+            return TIMED_OUT_OBSERVATION
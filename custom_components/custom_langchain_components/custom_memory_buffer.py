@@ -4,6 +4,7 @@ from langchain.memory import ConversationBufferMemory
 from langchain.schema.messages import HumanMessage, AIMessage, SystemMessage, FunctionMessage, ChatMessage
 from pydantic.v1 import Field
 import time
+from custom_components.custom_langchain_components.compiled_prompt import model_family, trim_to_tokens
 from custom_components.logger import setup_logger
 
 
@@ -66,6 +67,8 @@ class CustomBufferMemory(ConversationBufferMemory):
     ai_prefix: str = "Assistant" if llm == "zephyr" else "AI"
     debug: bool = Field(default=False)
     chat_history_n: int = Field(default=2)
+    max_history_tokens: int = Field(default=0)
+    """Token budget of the history string, the oldest turns are dropped to fit. 0 for no budget."""
 
     @property
     def buffer(self) -> Any:
@@ -83,6 +86,8 @@ class CustomBufferMemory(ConversationBufferMemory):
             ai_prefix=self.ai_prefix,
             n=self.chat_history_n
         )
+        if self.max_history_tokens:
+            buffer_as_string = trim_to_tokens(buffer_as_string, self.max_history_tokens, keep="end")
 
         return buffer_as_string
     @property
@@ -99,20 +104,28 @@ class CustomBufferMemory(ConversationBufferMemory):
         username and prompt_id to the additional_kwargs of the messages
         """
 
+        family = model_family(self.llm)
         additional_kwargs = {
             "timestamp": time.time(),
             "username": self.username, "prompt_id": self.prompt_id}
 
-        all_messages=self.chat_memory.messages.copy()
-        self.chat_memory.clear()
+        all_messages = self.chat_memory.messages.copy()
+        changed = False
         for message in all_messages:
             if not message.additional_kwargs:
-                message.additional_kwargs=additional_kwargs
-            if self.llm == "llama2":
-                if message.type == "human":
-                    if "[/INST]" not in message.content:
-                        message.content = f"{message.content} [/INST]"
-                elif message.type == "ai":
-                    if "</s><s>[INST]" not in message.content:
-                        message.content = f"{message.content} </s><s>[INST]"
-            self.chat_memory.add_message(message)
+                message.additional_kwargs = additional_kwargs
+                changed = True
+            if message.type == "human":
+                suffix = family.human_suffix
+            elif message.type == "ai":
+                suffix = family.ai_suffix
+            else:
+                continue
+            if suffix and suffix.strip() not in message.content:
+                message.content = f"{message.content}{suffix}"
+                changed = True
+        # Messages already in the model format are not rewritten on every turn
+        if changed:
+            self.chat_memory.clear()
+            for message in all_messages:
+                self.chat_memory.add_message(message)
@@ -1,16 +1,57 @@
+from typing import Any
+
 from langchain.prompts import StringPromptTemplate
-from pydantic import Field
+# langchain models are pydantic v1 models, as in custom_memory_buffer.py
+from pydantic.v1 import Field
+
+from custom_components.custom_langchain_components.compiled_prompt import (
+    LLAMA2,
+    compile_template,
+    default_token_budget,
+)
 
 
 class CustomPromptTemplate(StringPromptTemplate):
     pre_prompt: str = Field(default='')
     context: str = Field(default='')
     template: str
+    max_tokens: int = Field(default=0)
+    """Token budget of the prompt, history and context are trimmed to fit. 0 uses PROMPT_TOKEN_BUDGET."""
 
     def format(self, **kwargs) -> str:
+        # pre_prompt is rendered into the compiled template once, context
+        # stays a slot so it can be trimmed to the budget with the history
         kwargs['context'] = self.context
-        kwargs['pre_prompt'] = self.pre_prompt
-        return self.template.format(**kwargs)
+        compiled = compile_template(self.template, pre_prompt=self.pre_prompt)
+        return compiled.render(budget=self.max_tokens or default_token_budget(), **kwargs)
+
+
+class CompiledPromptTemplate(StringPromptTemplate):
+    """
+    PromptTemplate rendering through a CompiledTemplate, so the static text
+    of large templates (system prompts) is processed and counted only once.
+    """
+
+    template: str
+    max_tokens: int = Field(default=0)
+    reserved_tokens: int = Field(default=0)
+    """Tokens of the other messages of the chat prompt, the budget covers the whole prompt."""
+
+    @classmethod
+    def from_template(cls, template: str, **kwargs: Any) -> "CompiledPromptTemplate":
+        slots = compile_template(template).slots
+        return cls(template=template, input_variables=list(slots), **kwargs)
+
+    @property
+    def _prompt_type(self) -> str:
+        return "compiled"
+
+    def format(self, **kwargs) -> str:
+        kwargs = self._merge_partial_and_user_variables(**kwargs)
+        budget = self.max_tokens or default_token_budget()
+        if budget:
+            budget = max(1, budget - self.reserved_tokens)
+        return compile_template(self.template).render(budget=budget, **kwargs)
 
 
 if __name__ == "__main__":
@@ -18,13 +59,13 @@ if __name__ == "__main__":
 
     template = ""
     if model_type == "llama2":
-        template = template + "<s>[INST]<<SYS>>\n"
+        template = template + LLAMA2.bos + LLAMA2.inst_start + LLAMA2.sys_start
     template = template + "{pre_prompt}\n\nContext sections:\n{context}\n"
     if model_type == "llama2":
-        template = template + "<</SYS>>"
+        template = template + LLAMA2.sys_end.strip("\n")
     template = template + "\n\nCurrent conversation:\n{history}"
     if model_type == "llama2":
-        template = template + "\n\n {input} [/INST]"
+        template = template + "\n\n {input} " + LLAMA2.inst_end
     else:
         template = template + "\n\nQuestion:\n{input}\n\nanswer:\n"
 
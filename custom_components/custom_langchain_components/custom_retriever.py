@@ -3,6 +3,7 @@ from langchain.docstore.document import Document
 from typing import List, Optional
 from langchain.callbacks.manager import CallbackManagerForRetrieverRun
 from custom_components.embedding_svc_client import EmbeddingSVC
+from custom_components.runtime.deadline import deadline_errors, remaining_timeout
 
 
 class CustomRetriever(BaseRetriever, EmbeddingSVC):
@@ -22,16 +23,17 @@ class CustomRetriever(BaseRetriever, EmbeddingSVC):
         :param query: String value of the query
 
         """
-
-        response = self.query_db(
-            endpoint=self.endpoint,
-            query=query,
-            filter_options=self.filter_options,
-            collection_name=self.collection_name,
-            limit=self.top_k,
-            user_collection_name=self.user_collection_name,
-            master_collection_name=self.master_collection_name,
-            score_threshold=self.score_threshold)
+        with deadline_errors("retrieving documents"):
+            response = self.query_db(
+                endpoint=self.endpoint,
+                query=query,
+                filter_options=self.filter_options,
+                collection_name=self.collection_name,
+                limit=self.top_k,
+                user_collection_name=self.user_collection_name,
+                master_collection_name=self.master_collection_name,
+                score_threshold=self.score_threshold,
+                timeout=remaining_timeout())
 
         result_docs = list()
         for c, i in enumerate(response['embeddings']):
@@ -0,0 +1,84 @@
+import sqlalchemy.types as sqltypes
+from sqlalchemy.engine import reflection
+from sqlalchemy_dpn.dialects import DPNDialect
+
+from custom_components.custom_langchain_components.dpn_schema_catalog import get_schema_catalog, sql_type_name
+from custom_components.logger import setup_logger
+from custom_components.runtime.deadline import remaining_timeout
+
+logger = setup_logger(__name__)
+
+# Flight SQL RPC timeouts, see adbc_driver_flightsql.StatementOptions
+TIMEOUT_OPTIONS = (
+    "adbc.flight.sql.rpc.timeout_seconds.query",
+    "adbc.flight.sql.rpc.timeout_seconds.fetch",
+)
+
+# NOTE: methods with reflection.cache decorator cannot have types
+# it breaks in sqlalchemy v1.4.51, v2 is ok
+
+
+class SnapshotDPNDialect(DPNDialect):
+    """
+    DPN dialect that answers reflection from the process-wide schema snapshot
+    instead of issuing `adbc_get_objects` calls on every new connection, and
+    that bounds query execution by the request deadline.
+
+    Falls back to the sqlalchemy_dpn implementation whenever the snapshot is
+    unavailable or does not know the requested object.
+    """
+
+    supports_statement_cache = True
+
+    def _apply_deadline(self, cursor):
+        # Bound the Flight SQL calls of this statement by the request deadline
+        timeout = remaining_timeout()
+        if timeout is None:
+            return
+        try:
+            cursor.adbc_statement.set_options(**{option: str(timeout) for option in TIMEOUT_OPTIONS})
+        except Exception as e:
+            logger.debug(f"Could not set statement timeout: {type(e).__name__} - {e}")
+
+    def do_execute(self, cursor, statement, parameters, context=None):
+        self._apply_deadline(cursor)
+        super().do_execute(cursor, statement, parameters, context)
+
+    def do_execute_no_params(self, cursor, statement, context=None):
+        self._apply_deadline(cursor)
+        super().do_execute_no_params(cursor, statement, context)
+
+    def _snapshot(self, connection):
+        catalog = get_schema_catalog(connection.engine.url)
+        return catalog.ensure(self._get_dbapi_connection(connection))
+
+    @reflection.cache
+    def get_table_names(self, connection, schema=None, **kw):
+        snapshot = self._snapshot(connection)
+        if snapshot is None or (schema is not None and schema not in snapshot.schemas):
+            return super().get_table_names(connection, schema=schema, **kw)
+        return snapshot.table_names(schema)
+
+    @reflection.cache
+    def get_schema_names(self, connection, **kw):
+        snapshot = self._snapshot(connection)
+        if snapshot is None:
+            return super().get_schema_names(connection, **kw)
+        return snapshot.schema_names()
+
+    @reflection.cache
+    def get_columns(self, connection, table_name, schema=None, **kw):
+        snapshot = self._snapshot(connection)
+        columns = snapshot.columns(table_name, schema) if snapshot is not None else None
+        if not columns or any(sql_type_name(c["type_name"]) is None for c in columns):
+            return super().get_columns(connection, table_name, schema=schema, **kw)
+        return [
+            {
+                "name": c["name"],
+                "type": getattr(sqltypes, sql_type_name(c["type_name"])),
+                "nullable": c["nullable"],
+                "default": None,
+                "comment": None,
+            }
+            for c in columns
+        ]
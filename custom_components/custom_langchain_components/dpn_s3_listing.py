@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from custom_components.logger import setup_logger
+from custom_components.runtime.deadline import check_deadline
+
+logger = setup_logger(__name__)
+
+DEFAULT_ENDPOINT_URL = "https://dpn-engine.genai.sc.eng.hitachivantara.com"
+DEFAULT_CACHE_TTL = 30.0
+DEFAULT_CACHE_MAX_ENTRIES = 64
+DEFAULT_CACHE_MAX_KEYS = 200000
+DEFAULT_MAX_POOL_CONNECTIONS = 20
+PAGE_SIZE = 1000
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_s3_client():
+    """Create an S3 client for the DPN engine from the DPN_S3_* environment variables."""
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=int(os.getenv("DPN_S3_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS)),
+        retries={"max_attempts": 3, "mode": "standard"},
+    )
+    # boto3.session.Session is not thread-safe, but the client it creates is.
+    return boto3.session.Session().client(
+        service_name="s3",
+        aws_access_key_id=os.getenv("DPN_S3_ACCESS_KEY_ID", "dpnaccesskeyid"),
+        aws_secret_access_key=os.getenv("DPN_S3_SECRET_ACCESS_KEY", "dpnsecretaccesskey"),
+        verify=os.getenv("DPN_S3_VERIFY", "false").lower() == "true",
+        endpoint_url=os.getenv("DPN_S3_ENDPOINT_URL", DEFAULT_ENDPOINT_URL),
+        config=config,
+    )
+
+
+def get_s3_client():
+    """Return the process-wide S3 client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_s3_client()
+    return _client
+
+
+class BucketListing:
+    """Result of listing a bucket: object keys, common prefixes and whether it was cut at `limit`."""
+
+    def __init__(self, bucket: str, prefix: str = "", keys: Optional[List[str]] = None,
+                 sizes: Optional[List[int]] = None, common_prefixes: Optional[List[str]] = None,
+                 truncated: bool = False):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.keys = keys or []
+        self.sizes = sizes or []
+        self.common_prefixes = common_prefixes or []
+        self.truncated = truncated
+
+    def top_prefixes(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The `n` first-level prefixes (below `self.prefix`) holding the most keys."""
+        counts = Counter()
+        for key in self.keys:
+            rest = key[len(self.prefix):]
+            if "/" in rest:
+                counts[self.prefix + rest.split("/", 1)[0] + "/"] += 1
+        for prefix in self.common_prefixes:
+            counts.setdefault(prefix, 0)
+        return counts.most_common(n)
+
+    def summarize(self, max_keys: int) -> Dict[str, Any]:
+        """
+        Keep the listing small enough to hand to the LLM: every key when there
+        are at most `max_keys`, otherwise counts, top prefixes and a sample.
+        """
+        result: Dict[str, Any] = {"results": self.keys}
+        if self.common_prefixes:
+            result["prefixes"] = self.common_prefixes
+        if len(self.keys) <= max_keys and not self.truncated:
+            return result
+        result = {
+            "results": self.keys[:max_keys],
+            "object_count": len(self.keys),
+            "total_size_bytes": sum(self.sizes),
+            "top_prefixes": [{"prefix": p, "objects": c} for p, c in self.top_prefixes()],
+            "truncated": self.truncated,
+        }
+        if self.common_prefixes:
+            result["prefixes"] = self.common_prefixes[:max_keys]
+        return result
+
+
+def list_bucket(bucket: str, prefix: str = "", delimiter: Optional[str] = None,
+                limit: Optional[int] = None, client=None) -> BucketListing:
+    """
+    List a bucket with ListObjectsV2, following continuation tokens until the
+    bucket is exhausted or `limit` keys have been collected. With a `limit`
+    the paginator stops there itself and no page asks for more keys than
+    are still needed.
+    """
+    client = client or get_s3_client()
+    paginator = client.get_paginator("list_objects_v2")
+    params: Dict[str, Any] = {"Bucket": bucket, "Prefix": prefix}
+    if delimiter:
+        params["Delimiter"] = delimiter
+    pagination: Dict[str, int] = {"PageSize": PAGE_SIZE}
+    if limit is not None:
+        pagination = {"MaxItems": limit, "PageSize": max(1, min(limit, PAGE_SIZE))}
+    listing = BucketListing(bucket, prefix)
+    pages = paginator.paginate(**params, PaginationConfig=pagination)
+    for page in pages:
+        check_deadline(f"listing bucket {bucket}")
+        for obj in page.get("Contents", []):
+            listing.keys.append(obj["Key"])
+            listing.sizes.append(obj.get("Size", 0))
+        listing.common_prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    # Set once MaxItems cut the listing short of the end of the bucket
+    listing.truncated = pages.resume_token is not None
+    return listing
+
+
+class BucketListingCache:
+    """
+    Thread-safe TTL cache of bucket listings keyed by (bucket, prefix,
+    delimiter, limit). Bucket names come from the LLM, so the cache is bounded
+    by its number of listings and the keys they hold together, least recently
+    used listings first out. Expired listings are dropped on every write.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_CACHE_TTL, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+                 max_keys: int = DEFAULT_CACHE_MAX_KEYS, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple, Tuple[float, BucketListing]]" = OrderedDict()
+        self._keys = 0
+        self._lock = threading.Lock()
+
+    def get_or_list(self, bucket: str, prefix: str = "", delimiter: Optional[str] = None,
+                    limit: Optional[int] = None, client=None) -> BucketListing:
+        key = (bucket, prefix, delimiter, limit)
+        now = self._clock()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(key)
+                return cached[1]
+        listing = list_bucket(bucket, prefix=prefix, delimiter=delimiter, limit=limit, client=client)
+        if self.ttl > 0 and self.max_entries > 0 and self._size(listing) <= self.max_keys:
+            with self._lock:
+                self._put(key, (now + self.ttl, listing), now)
+        return listing
+
+    @staticmethod
+    def _size(listing: BucketListing) -> int:
+        return len(listing.keys) + len(listing.common_prefixes)
+
+    def _put(self, key: Tuple, entry: Tuple[float, BucketListing], now: float):
+        """Store `entry`, dropping expired and least recently used listings. Caller holds the lock."""
+        self._remove(key)
+        for expired in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            self._remove(expired)
+        self._entries[key] = entry
+        self._keys += self._size(entry[1])
+        while len(self._entries) > self.max_entries or self._keys > self.max_keys:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._keys -= self._size(entry[1])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def invalidate(self, bucket: Optional[str] = None):
+        with self._lock:
+            if bucket is None:
+                self._entries.clear()
+                self._keys = 0
+            else:
+                for key in [k for k in self._entries if k[0] == bucket]:
+                    self._remove(key)
+
+
+_listing_cache: Optional[BucketListingCache] = None
+
+
+def get_listing_cache() -> BucketListingCache:
+    global _listing_cache
+    if _listing_cache is None:
+        with _client_lock:
+            if _listing_cache is None:
+                _listing_cache = BucketListingCache(
+                    ttl=float(os.getenv("DPN_S3_LISTING_CACHE_TTL", DEFAULT_CACHE_TTL)),
+                    max_entries=int(os.getenv("DPN_S3_LISTING_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES)),
+                    max_keys=int(os.getenv("DPN_S3_LISTING_CACHE_MAX_KEYS", DEFAULT_CACHE_MAX_KEYS)),
+                )
+    return _listing_cache
+
+
+def parse_bucket_input(value: str) -> Tuple[str, str]:
+    """
+    Split the agent's tool input into bucket and prefix. Accepts `demo`,
+    `'demo'`, `demo/reports/` and `s3://demo/reports/`.
+    """
+    value = value.strip().strip("'\"").strip()
+    if value.startswith("s3://"):
+        value = value[len("s3://"):]
+    bucket, _, prefix = value.partition("/")
+    return bucket, prefix
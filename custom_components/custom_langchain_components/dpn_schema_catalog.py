@@ -0,0 +1,247 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 300.0
+DIALECT_NAME = "dpn.flightsql"
+
+# Arrow type names reported by the Flight SQL server (xdbc_type_name) mapped
+# to the sqlalchemy types the bundled dialect would have resolved.
+TYPE_NAMES = {
+    "BINARY": "BINARY",
+    "VARBINARY": "BINARY",
+    "BOOLEAN": "BOOLEAN",
+    "BOOL": "BOOLEAN",
+    "DATE": "DATE",
+    "DECIMAL": "DECIMAL",
+    "NUMERIC": "DECIMAL",
+    "FLOAT": "FLOAT",
+    "DOUBLE": "FLOAT",
+    "REAL": "FLOAT",
+    "VARCHAR": "TEXT",
+    "CHAR": "TEXT",
+    "TEXT": "TEXT",
+    "STRING": "TEXT",
+    "UTF8": "TEXT",
+    "TIME": "TIME",
+    "TIMESTAMP": "TIMESTAMP",
+    "INTERVAL": "Interval",
+    "TINYINT": "SMALLINT",
+    "SMALLINT": "SMALLINT",
+    "INT": "INTEGER",
+    "INTEGER": "INTEGER",
+    "BIGINT": "BIGINT",
+}
+
+
+def sql_type_name(type_name: Optional[str]) -> Optional[str]:
+    """Map a server type name such as `VARCHAR(32)` to a sqlalchemy.types name."""
+    if not type_name:
+        return None
+    return TYPE_NAMES.get(re.split(r"[\s(]", type_name.strip().upper(), 1)[0])
+
+
+class SchemaSnapshot:
+    """
+    Immutable view of the DPN catalog: schema -> table -> columns.
+
+    Each column is a dict with `name`, `type_name` and `nullable` keys.
+    """
+
+    def __init__(self, schemas: Dict[str, Dict[str, List[Dict[str, Any]]]], fetched_at: Optional[float] = None):
+        self.schemas = schemas
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self._table_info: Optional[str] = None
+
+    @classmethod
+    def from_arrow(cls, table) -> "SchemaSnapshot":
+        """
+        Build a snapshot from the result of `adbc_get_objects(depth="columns")`.
+
+        The nested catalog -> schema -> table -> column lists are flattened
+        column-wise with Arrow compute, rows are never materialized as dicts.
+        """
+        import pyarrow.compute as pc
+
+        schemas = pc.list_flatten(table.column("catalog_db_schemas").combine_chunks())
+        schema_names = schemas.field("db_schema_name").to_numpy(zero_copy_only=False)
+
+        tables_list = schemas.field("db_schema_tables")
+        table_parents = pc.list_parent_indices(tables_list).to_numpy()
+        tables = pc.list_flatten(tables_list)
+        table_names = tables.field("table_name").to_numpy(zero_copy_only=False)
+
+        columns_list = tables.field("table_columns")
+        column_parents = pc.list_parent_indices(columns_list).to_numpy()
+        columns = pc.list_flatten(columns_list)
+        column_names = columns.field("column_name").to_numpy(zero_copy_only=False)
+        type_names = columns.field("xdbc_type_name").to_numpy(zero_copy_only=False)
+        nullable = pc.fill_null(columns.field("xdbc_nullable"), 1).to_numpy()
+
+        result: Dict[str, Dict[str, List[Dict[str, Any]]]] = {name or "": {} for name in schema_names}
+        table_columns: List[List[Dict[str, Any]]] = []
+        for schema_index, table_name in zip(table_parents, table_names):
+            cols: List[Dict[str, Any]] = []
+            result[schema_names[schema_index] or ""][table_name] = cols
+            table_columns.append(cols)
+        for table_index, name, type_name, is_nullable in zip(column_parents, column_names, type_names, nullable):
+            table_columns[table_index].append({"name": name, "type_name": type_name, "nullable": bool(is_nullable)})
+        return cls(result)
+
+    def schema_names(self) -> List[str]:
+        return list(self.schemas)
+
+    def table_names(self, schema: Optional[str] = None) -> List[str]:
+        if schema is not None:
+            return list(self.schemas.get(schema, {}))
+        return [table for tables in self.schemas.values() for table in tables]
+
+    def columns(self, table_name: str, schema: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        schemas = [self.schemas.get(schema, {})] if schema is not None else self.schemas.values()
+        for tables in schemas:
+            if table_name in tables:
+                return tables[table_name]
+        return None
+
+    def table_info(self) -> str:
+        """Return a compact, prompt-ready description of every table, rendered once."""
+        if self._table_info is None:
+            lines = []
+            for schema, tables in self.schemas.items():
+                for table, cols in tables.items():
+                    name = f"{schema}.{table}" if schema else table
+                    rendered = ", ".join(f"{c['name']} {c['type_name'] or ''}".strip() for c in cols)
+                    lines.append(f"{name}({rendered})")
+            self._table_info = "\n".join(lines)
+        return self._table_info
+
+
+def _catalog_key(url) -> str:
+    from sqlalchemy.engine import make_url
+
+    rendered = make_url(url).render_as_string(hide_password=False)
+    return hashlib.sha256(rendered.encode("utf-8")).hexdigest()
+
+
+class SchemaCatalog:
+    """
+    Process-wide schema snapshot for one DPN endpoint.
+
+    The snapshot is fetched with a single `adbc_get_objects` call and then
+    refreshed by a daemon thread every `refresh_interval` seconds. Readers
+    never block on a refresh; on failure the previous snapshot is kept.
+    """
+
+    def __init__(self, url, refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+                 connect: Optional[Callable[[], Any]] = None):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self._connect = connect
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._fetch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def snapshot(self) -> Optional[SchemaSnapshot]:
+        return self._snapshot
+
+    def fetch(self, dbapi_conn) -> SchemaSnapshot:
+        """Fetch a new snapshot over `dbapi_conn` and publish it."""
+        started = time.perf_counter()
+        reader = dbapi_conn.adbc_get_objects(depth="columns")
+        snapshot = SchemaSnapshot.from_arrow(reader.read_all())
+        self._snapshot = snapshot
+        logger.info(
+            f"Fetched DPN schema snapshot with {len(snapshot.table_names())} tables "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+        return snapshot
+
+    def ensure(self, dbapi_conn=None) -> Optional[SchemaSnapshot]:
+        """
+        Return the current snapshot. If there is none yet it is fetched over
+        `dbapi_conn` (when given) and the background refresher is started.
+        """
+        if self._snapshot is None and dbapi_conn is not None:
+            with self._fetch_lock:
+                if self._snapshot is None:
+                    try:
+                        self.fetch(dbapi_conn)
+                    except Exception as e:
+                        logger.warning(f"Could not fetch DPN schema snapshot: {type(e).__name__} - {e}")
+        self.start()
+        return self._snapshot
+
+    def refresh(self):
+        if self._connect is not None:
+            dbapi_conn = self._connect()
+        else:
+            from sqlalchemy import create_engine
+            from sqlalchemy.pool import NullPool
+
+            register_dialect()
+            dbapi_conn = create_engine(self.url, poolclass=NullPool).raw_connection()
+        try:
+            with self._fetch_lock:
+                self.fetch(dbapi_conn)
+        finally:
+            dbapi_conn.close()
+
+    def start(self):
+        if self.refresh_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._fetch_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="dpn-schema-catalog", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        # Without a snapshot yet, fetch right away instead of after a full interval.
+        wait = 0 if self._snapshot is None else self.refresh_interval
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"DPN schema snapshot refresh failed: {type(e).__name__} - {e}")
+            wait = self.refresh_interval
+
+
+_catalogs: Dict[str, SchemaCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_schema_catalog(url) -> SchemaCatalog:
+    """Return the shared SchemaCatalog for the DPN connection `url`."""
+    key = _catalog_key(url)
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(key)
+            if catalog is None:
+                interval = float(os.getenv("DPN_SCHEMA_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL))
+                catalog = _catalogs[key] = SchemaCatalog(url, refresh_interval=interval)
+    return catalog
+
+
+def register_dialect():
+    """
+    Make `dpn+flightsql://` URLs use SnapshotDPNDialect instead of the plain
+    dialect from the sqlalchemy_dpn entry point. The dialect module is only
+    imported when the first engine is created.
+    """
+    from sqlalchemy.dialects import registry
+
+    registry.register(DIALECT_NAME, "custom_components.custom_langchain_components.dpn_dialect", "SnapshotDPNDialect")
@@ -0,0 +1,138 @@
+import json
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+from langchain.agents.agent import AgentOutputParser
+from langchain.agents.format_scratchpad import format_log_to_str
+from langchain.output_parsers.json import parse_json_markdown
+from langchain.tools import BaseTool
+from langchain.tools.render import render_text_description_and_args
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.prompts.chat import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnablePassthrough
+
+from custom_components.custom_langchain_components.json_repair import extract_blocks, repair_json_actions, split_values
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_metrics = {"parsed": 0, "repaired": 0, "reprompted": 0}
+_metrics_lock = threading.Lock()
+
+
+def _count(outcome: str):
+    with _metrics_lock:
+        _metrics[outcome] += 1
+
+
+def get_parse_metrics() -> Dict[str, int]:
+    """
+    Counts of agent outputs that parsed as is, were repaired locally and had
+    to be sent back to the LLM.
+    """
+    with _metrics_lock:
+        return dict(_metrics)
+
+
+class RepairingJSONAgentOutputParser(AgentOutputParser):
+    """
+    Drop-in replacement for JSONAgentOutputParser that repairs malformed JSON
+    locally before giving up. Only outputs that cannot be repaired raise
+    OutputParserException, which the executor turns into a re-prompt when
+    `handle_parsing_errors` is set.
+
+    Several tool actions in one output, as a JSON list or as separate blocks,
+    are returned together so the executor can run them in the same step.
+    """
+
+    def parse(self, text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        values = [value for block in extract_blocks(text) for value in split_values(block)]
+        if len(values) == 1 and values[0].startswith("{"):
+            # A single action. parse_json_markdown also copes with unescaped
+            # quotes and newlines in action_input.
+            try:
+                responses = [parse_json_markdown(text)]
+                responses[0]["action"]
+            except Exception:
+                responses = None
+        else:
+            # parse_json_markdown only reads the first block and its action_input
+            # escaping swallows the actions after the first one of a list
+            responses = self._load_actions(values)
+        repaired = responses is None
+        if repaired:
+            responses = repair_json_actions(text)
+        if not responses:
+            _count("reprompted")
+            raise OutputParserException(f"Could not parse LLM output: {text}")
+        if repaired:
+            _count("repaired")
+            logger.debug(f"Repaired LLM output locally: {responses}")
+        else:
+            _count("parsed")
+        return self._to_agent_output(responses, text)
+
+    @staticmethod
+    def _load_actions(values: List[str]) -> Optional[List[dict]]:
+        """The actions of well-formed JSON `values`, None if any of them needs repairing."""
+        actions = []
+        for value in values:
+            try:
+                parsed = json.loads(value, strict=False)
+            except ValueError:
+                return None
+            for item in parsed if isinstance(parsed, list) else [parsed]:
+                if not isinstance(item, dict) or "action" not in item:
+                    return None
+                actions.append(item)
+        return actions or None
+
+    @staticmethod
+    def _to_agent_output(responses: List[dict], text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        actions = [r for r in responses if r["action"] != "Final Answer"]
+        if not actions:
+            return AgentFinish({"output": responses[0].get("action_input", "")}, text)
+        if len(actions) == 1:
+            return AgentAction(actions[0]["action"], actions[0].get("action_input", {}), text)
+        # Several independent actions in one turn. Each one logs its own blob so
+        # the scratchpad pairs every action with its observation.
+        return [
+            AgentAction(a["action"], a.get("action_input", {}), f"```json\n{json.dumps(a)}\n```")
+            for a in actions
+        ]
+
+    @property
+    def _type(self) -> str:
+        return "repairing-json-agent"
+
+
+def create_structured_chat_agent(
+    llm: BaseLanguageModel,
+    tools: Sequence[BaseTool],
+    prompt: ChatPromptTemplate,
+    output_parser: Optional[AgentOutputParser] = None,
+) -> Runnable:
+    """
+    Same as `langchain.agents.create_structured_chat_agent` but parsing the
+    model output with RepairingJSONAgentOutputParser by default.
+    """
+    missing_vars = {"tools", "tool_names", "agent_scratchpad"}.difference(prompt.input_variables)
+    if missing_vars:
+        raise ValueError(f"Prompt missing required variables: {missing_vars}")
+
+    prompt = prompt.partial(
+        tools=render_text_description_and_args(list(tools)),
+        tool_names=", ".join([t.name for t in tools]),
+    )
+    llm_with_stop = llm.bind(stop=["Observation"])
+
+    return (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_log_to_str(x["intermediate_steps"]),
+        )
+        | prompt
+        | llm_with_stop
+        | (output_parser or RepairingJSONAgentOutputParser())
+    )
@@ -0,0 +1,155 @@
+import json
+import re
+from typing import Any, List, Optional
+
+# The system prompt escapes its closing fences (\```), models copy that.
+_ESCAPED_FENCE_RE = re.compile(r"\\+```")
+_LANGUAGE_TAG_RE = re.compile(r"^\s*json\b", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def extract_blocks(text: str) -> List[str]:
+    """
+    Return the fenced blocks of `text`. An unclosed fence runs to the end of
+    the text. Without any fence the whole text is the only block.
+    """
+    text = _ESCAPED_FENCE_RE.sub("```", text)
+    parts = text.split("```")
+    if len(parts) == 1:
+        return [text]
+    return [_LANGUAGE_TAG_RE.sub("", parts[i], count=1) for i in range(1, len(parts), 2)]
+
+
+def split_values(block: str) -> List[str]:
+    """
+    Split a block into its top-level JSON object/array substrings, dropping
+    any text around them. A value left open at the end of the block is
+    returned as is.
+    """
+    values = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    escaped = False
+    start = None
+    for i, char in enumerate(block):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if not stack:
+            if char in _CLOSERS:
+                start = i
+                stack.append(char)
+            continue
+        if char in "\"'":
+            quote = char
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in "}]":
+            stack.pop()
+            if not stack:
+                values.append(block[start:i + 1])
+                start = None
+    if start is not None:
+        values.append(block[start:])
+    return values
+
+
+def to_double_quotes(value: str) -> str:
+    """Rewrite single-quoted strings as JSON double-quoted strings."""
+    out = []
+    quote: Optional[str] = None
+    escaped = False
+    for char in value:
+        if escaped:
+            escaped = False
+            # \' is not a valid JSON escape, the quote no longer needs one
+            out.append(char if quote == "'" and char == "'" else "\\" + char)
+        elif quote and char == "\\":
+            escaped = True
+        elif quote == "'" and char == '"':
+            out.append('\\"')
+        elif char == quote:
+            quote = None
+            out.append('"')
+        elif quote is None and char in "'\"":
+            quote = char
+            out.append('"')
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def close_open(value: str) -> str:
+    """Terminate an unfinished string and add the missing closing brackets."""
+    stack: List[str] = []
+    quote: Optional[str] = None
+    escaped = False
+    for char in value:
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char == '"':
+            quote = char
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in "}]" and stack:
+            stack.pop()
+    suffix = (quote or "") + "".join(_CLOSERS[c] for c in reversed(stack))
+    return value.rstrip().rstrip(",") + suffix if not quote else value + suffix
+
+
+def repair_value(value: str) -> Any:
+    """
+    Parse `value` as JSON, applying increasingly aggressive fixes until it
+    parses. Raises ValueError if nothing works.
+    """
+    attempts = [value]
+    if value.startswith(("{{", "[{{")):
+        attempts.append(value.replace("{{", "{").replace("}}", "}"))
+    for candidate in list(attempts):
+        if "'" in candidate:
+            attempts.append(to_double_quotes(candidate))
+    for candidate in list(attempts):
+        attempts.append(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+    for candidate in list(attempts):
+        attempts.append(_TRAILING_COMMA_RE.sub(r"\1", close_open(candidate)))
+    for candidate in attempts:
+        try:
+            return json.loads(candidate, strict=False)
+        except ValueError:
+            continue
+    raise ValueError(f"Could not repair JSON: {value}")
+
+
+def repair_json_actions(text: str) -> List[dict]:
+    """
+    Recover every `{"action": ..., "action_input": ...}` blob from a model
+    output, tolerating unbalanced or escaped fences, text around the JSON,
+    single quotes, missing closing braces and several action blocks.
+    """
+    actions = []
+    blocks = extract_blocks(text)
+    values = [v for block in blocks for v in split_values(block)]
+    if not values and len(blocks) > 1:
+        values = split_values(text)
+    for value in values:
+        try:
+            parsed = repair_value(value)
+        except ValueError:
+            continue
+        for item in parsed if isinstance(parsed, list) else [parsed]:
+            if isinstance(item, dict) and "action" in item:
+                actions.append(item)
+    return actions
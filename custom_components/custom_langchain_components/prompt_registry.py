@@ -0,0 +1,187 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Prompts shipped with the runtime, stored as <owner>/<name>.json
+PROMPTS_DIR = Path(__file__).parent / "prompts"
+DEFAULT_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "langflow-runtime" / "prompts"
+
+
+def is_offline() -> bool:
+    """PROMPT_REGISTRY_OFFLINE=true makes the registry never reach out to the hub."""
+    return os.getenv("PROMPT_REGISTRY_OFFLINE", "false").lower() == "true"
+
+
+def load_local_spec(prompt_id: str) -> Optional[Dict[str, Any]]:
+    """Return the spec of a prompt shipped with the runtime, or None."""
+    path = (PROMPTS_DIR / f"{prompt_id}.json").resolve()
+    if PROMPTS_DIR.resolve() not in path.parents or not path.is_file():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_from_spec(spec: Dict[str, Any]):
+    """Build a ChatPromptTemplate from a local prompt spec."""
+    from langchain.prompts import (
+        AIMessagePromptTemplate,
+        ChatPromptTemplate,
+        HumanMessagePromptTemplate,
+        MessagesPlaceholder,
+        SystemMessagePromptTemplate,
+    )
+
+    roles = {
+        "system": SystemMessagePromptTemplate,
+        "human": HumanMessagePromptTemplate,
+        "ai": AIMessagePromptTemplate,
+    }
+    messages = []
+    for message in spec["messages"]:
+        if message["role"] == "placeholder":
+            messages.append(MessagesPlaceholder(variable_name=message["variable_name"], optional=True))
+        else:
+            messages.append(roles[message["role"]].from_template(message["template"]))
+    prompt = ChatPromptTemplate.from_messages(messages)
+    prompt.input_variables = sorted(set(prompt.input_variables) | set(spec.get("input_variables", [])))
+    return prompt
+
+
+class PromptCache:
+    """
+    Content-addressed on-disk cache for prompts pulled from the hub.
+
+    Serialized prompts live in `objects/<sha256>.json`; `refs/<owner>/<name>`
+    holds the digest the prompt id currently resolves to.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _ref_path(self, prompt_id: str) -> Path:
+        return self.root / "refs" / prompt_id
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / f"{digest}.json"
+
+    def get(self, prompt_id: str) -> Optional[str]:
+        try:
+            digest = self._ref_path(prompt_id).read_text().strip()
+            content = self._object_path(digest).read_text()
+        except OSError:
+            return None
+        if hashlib.sha256(content.encode("utf-8")).hexdigest() != digest:
+            logger.warning(f"Ignoring corrupt cached prompt {prompt_id}")
+            return None
+        return content
+
+    def put(self, prompt_id: str, content: str) -> str:
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            _atomic_write(object_path, content)
+        _atomic_write(self._ref_path(prompt_id), digest)
+        return digest
+
+
+def _atomic_write(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(content)
+    os.replace(tmp, path)
+
+
+def get_prompt_cache() -> PromptCache:
+    return PromptCache(Path(os.getenv("PROMPT_CACHE_DIR", DEFAULT_CACHE_DIR)))
+
+
+def pull_prompt(prompt_id: str):
+    """
+    Resolve `prompt_id` from, in order: the prompts shipped with the runtime,
+    the on-disk cache of previously pulled prompts and finally the hub.
+
+    Resolved prompts are memoized, see _own_copy for what callers may change.
+    """
+    return _own_copy(_pull_prompt(prompt_id))
+
+
+def _own_copy(prompt):
+    """
+    Copy of the memoized `prompt` with its own lists and dicts (messages,
+    input and partial variables), so callers can add, replace or drop
+    messages and variables. The message templates themselves are shared
+    and must not be modified in place.
+    """
+    return prompt.copy(update={name: copy.copy(value) for name, value in prompt.__dict__.items()
+                               if isinstance(value, (list, dict))})
+
+
+@lru_cache(maxsize=None)
+def _pull_prompt(prompt_id: str):
+    spec = load_local_spec(prompt_id)
+    if spec is not None:
+        return build_from_spec(spec)
+
+    from langchain.load.dump import dumps
+    from langchain.load.load import loads
+
+    cache = get_prompt_cache()
+    cached = cache.get(prompt_id)
+    if cached is not None:
+        return loads(cached)
+
+    if is_offline():
+        raise LookupError(f"Prompt {prompt_id} is not available offline.")
+
+    import langchain.hub as hub
+
+    logger.info(f"Pulling prompt {prompt_id} from the hub")
+    prompt = hub.pull(prompt_id)
+    try:
+        cache.put(prompt_id, dumps(prompt))
+    except OSError as e:
+        logger.warning(f"Could not cache prompt {prompt_id}: {e}")
+    return prompt
+
+
+def get_chat_prompt(prompt_id: str, templates: Tuple[Optional[str], ...] = ()):
+    """
+    Return the chat prompt `prompt_id` with the template of the i-th message
+    replaced by `templates[i]` (None keeps the original).
+
+    Built prompts are memoized per (prompt id, templates), see _own_copy for
+    what callers may change.
+    """
+    return _own_copy(_build_chat_prompt(prompt_id, templates))
+
+
+@lru_cache(maxsize=64)
+def _build_chat_prompt(prompt_id: str, templates: Tuple[Optional[str], ...]):
+    from custom_components.custom_langchain_components.compiled_prompt import compile_template
+    from custom_components.custom_langchain_components.custom_prompt import CompiledPromptTemplate
+
+    prompt = _pull_prompt(prompt_id)
+    if not any(templates):
+        return prompt
+    prompt = prompt.copy(deep=True)
+    compiled = []
+    for message, template in zip(prompt.messages, templates):
+        if template is not None:
+            # Static text such as the system prompt is processed once, not on every agent turn
+            message.prompt = CompiledPromptTemplate.from_template(template)
+            compiled.append(message.prompt)
+    # The token budget covers the whole prompt: each message is trimmed to
+    # what the static text of the others leaves
+    static_tokens = [compile_template(p.template).static_tokens for p in compiled]
+    for p, tokens in zip(compiled, static_tokens):
+        p.reserved_tokens = sum(static_tokens) - tokens
+    return prompt
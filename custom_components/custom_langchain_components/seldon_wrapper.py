@@ -10,6 +10,8 @@ from langchain.llms.utils import enforce_stop_tokens
 from langchain.utils import get_from_dict_or_env
 from pydantic.v1 import Extra, root_validator
 
+from custom_components.runtime.deadline import deadline_errors, remaining_timeout
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_REPO_ID = "llama2-chat"
@@ -78,6 +80,7 @@ class InferenceApi:
         params: Optional[Dict] = None,
         data: Optional[Dict] = None,
         raw_response: bool = False,
+        timeout: Optional[float] = None,
     ) -> Any:
         """Make a call to the inference API."""
         if self.task == "question-answering":
@@ -88,7 +91,7 @@ class InferenceApi:
             params = {}
         request.update(params)
         payload = encode_request(request)
-        response = self.session.post(self.api_url, json=payload, data=data)
+        response = self.session.post(self.api_url, json=payload, data=data, timeout=timeout)
         response.raise_for_status()
 
         logger.debug(response)
@@ -142,6 +145,9 @@ class SeldonCore(LLM, Embeddings):
 
     endpoint_url: Optional[str] = None
 
+    request_timeout: Optional[float] = None
+    """Timeout of an inference call in seconds, capped by the request deadline."""
+
     class Config:
         """Configuration for this pydantic object."""
         extra = Extra.forbid
@@ -185,7 +191,8 @@ class SeldonCore(LLM, Embeddings):
         """Call out the Seldon API moder inference endpoint."""
         _model_kwargs = self.model_kwargs or {}
         params = {**_model_kwargs, **kwargs}
-        response = self.client(inputs=prompt, params=params)
+        with deadline_errors("the inference call"):
+            response = self.client(inputs=prompt, params=params, timeout=remaining_timeout(self.request_timeout))
         if "error" in response:
             raise ValueError(
                 f"Error raised by inference API: {response['error']}"
@@ -218,7 +225,8 @@ class SeldonCore(LLM, Embeddings):
 
     def embed_query(self, text: str) -> List[float]:
         """Embed query text."""
-        response = self.client(inputs=text)
+        with deadline_errors("the embedding call"):
+            response = self.client(inputs=text, timeout=remaining_timeout(self.request_timeout))
         if "error" in response:
             raise ValueError(
                 f"Error raised by inference API: {response['error']}"
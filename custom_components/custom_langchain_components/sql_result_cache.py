@@ -0,0 +1,314 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from custom_components.logger import setup_logger
+from custom_components.runtime.deadline import DeadlineExceeded, check_deadline, remaining_timeout
+
+logger = setup_logger(__name__)
+
+DEFAULT_TTL_SECONDS = 60.0
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Statements that are safe to serve from cache. Anything else bypasses it.
+READ_ONLY_KEYWORDS = ("select", "with", "show", "describe", "desc", "explain", "values")
+WRITE_KEYWORDS = {
+    "insert", "update", "delete", "merge", "upsert", "create", "drop", "alter",
+    "truncate", "grant", "revoke", "copy", "call", "exec", "execute", "set",
+    # SELECT ... INTO creates a table
+    "into",
+}
+SQL_KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "like",
+    "between", "as", "on", "join", "inner", "left", "right", "full", "outer",
+    "cross", "group", "by", "order", "having", "limit", "offset", "asc", "desc",
+    "distinct", "union", "all", "intersect", "except", "with", "case", "when",
+    "then", "else", "end", "count", "sum", "avg", "min", "max", "show", "tables",
+    "describe", "explain", "values", "true", "false", "cast",
+}
+
+# Quoted literals/identifiers are kept verbatim, everything else is normalized.
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|[^'\"`]+")
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TABLE_RE = re.compile(r"\b(?:from|join)\s+([A-Za-z_][\w.\"`]*)", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize a SQL statement for use as a cache key.
+
+    Whitespace is collapsed, keywords are lower-cased and a trailing semicolon
+    is dropped. String literals and quoted identifiers are left untouched.
+    """
+    sql = sql.strip()
+    if _is_wrapped(sql):
+        sql = sql[1:-1]
+    parts = []
+    for token in _TOKEN_RE.findall(sql):
+        if token[0] in "'\"`":
+            parts.append(token)
+            continue
+        token = re.sub(r"\s+", " ", token)
+        token = re.sub(r"\s*([(),=<>])\s*", r"\1", token)
+        parts.append(_WORD_RE.sub(lambda m: m.group(0).lower() if m.group(0).lower() in SQL_KEYWORDS else m.group(0), token))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _is_wrapped(sql: str) -> bool:
+    # The agent sometimes passes the query wrapped in quotes, e.g. "'select 1'"
+    return len(sql) > 1 and sql[0] == sql[-1] and sql[0] in "'\"" and sql.count(sql[0]) == 2
+
+
+def _keywords(normalized_sql: str) -> List[str]:
+    unquoted = " ".join(t for t in _TOKEN_RE.findall(normalized_sql) if t[0] not in "'\"`")
+    return [w.lower() for w in _WORD_RE.findall(unquoted)]
+
+
+def is_read_only(normalized_sql: str) -> bool:
+    """Return True if the statement is a single read-only query."""
+    unquoted = "".join(t for t in _TOKEN_RE.findall(normalized_sql) if t[0] not in "'\"`")
+    if ";" in unquoted:
+        return False
+    words = _keywords(normalized_sql)
+    if not words or words[0] not in READ_ONLY_KEYWORDS:
+        return False
+    return not any(word in WRITE_KEYWORDS for word in words)
+
+
+def referenced_tables(normalized_sql: str) -> List[str]:
+    """Return the lower-cased, unqualified names of tables read by the statement."""
+    tables = []
+    for match in _TABLE_RE.findall(normalized_sql):
+        name = match.split(".")[-1].strip("\"`").lower()
+        if name and name not in tables:
+            tables.append(name)
+    return tables
+
+
+def is_timeout(error: BaseException) -> bool:
+    """
+    Return True for a deadline error or a timeout of the query itself, e.g.
+    the ADBC rpc timeout (status TIMEOUT) of the Flight SQL call.
+    """
+    status = getattr(error, "status_code", None)
+    return isinstance(error, TimeoutError) or getattr(status, "name", None) == "TIMEOUT"
+
+
+def estimate_size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class _CacheEntry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value: Any, size: int, expires_at: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class _InFlight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryResultCache:
+    """
+    Byte-bounded LRU cache for read-only SQL results with per-table TTLs.
+
+    Concurrent calls for the same key are coalesced so only one of them
+    executes the query; the others wait for and share its result. When the
+    query of the leader times out, which its own deadline may have caused,
+    one of the waiting calls runs it again with its own deadline instead.
+
+    Example:
+        .. code-block:: python
+
+            cache = QueryResultCache(table_ttls={"chargebacktenant": 300})
+            rows = cache.get_or_execute(query, identity=db_uri, execute=lambda: db.run(query))
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        default_ttl: float = DEFAULT_TTL_SECONDS,
+        table_ttls: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.table_ttls = {k.lower(): float(v) for k, v in (table_ttls or {}).items()}
+        self._clock = clock
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "bypassed": 0,
+            "expired": 0,
+            "evictions": 0,
+            "errors": 0,
+            "retried": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "QueryResultCache":
+        """
+        Build a cache from DPN_SQL_CACHE_MAX_BYTES, DPN_SQL_CACHE_TTL and
+        DPN_SQL_CACHE_TABLE_TTLS (a JSON object of table name to seconds).
+        """
+        table_ttls = json.loads(os.getenv("DPN_SQL_CACHE_TABLE_TTLS", "{}") or "{}")
+        return cls(
+            max_bytes=int(os.getenv("DPN_SQL_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            default_ttl=float(os.getenv("DPN_SQL_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            table_ttls=table_ttls,
+        )
+
+    @staticmethod
+    def make_key(normalized_sql: str, identity: str) -> str:
+        # The identity usually is the connection URI which embeds the token,
+        # hash it so credentials are never kept around in cache keys.
+        digest = hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+        return f"{digest}:{normalized_sql}"
+
+    def ttl_for(self, tables: Iterable[str]) -> float:
+        ttls = [self.table_ttls[t] for t in tables if t in self.table_ttls]
+        return min(ttls) if ttls else self.default_ttl
+
+    def get_or_execute(self, sql: str, identity: str, execute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for `sql` or run `execute` to produce it.
+
+        Statements that are not read-only, or whose TTL is 0, always run
+        `execute` and are never stored.
+        """
+        normalized = normalize_sql(sql)
+        tables = referenced_tables(normalized)
+        ttl = self.ttl_for(tables)
+        if ttl <= 0 or not is_read_only(normalized):
+            with self._lock:
+                self._metrics["bypassed"] += 1
+            return execute()
+
+        key = self.make_key(normalized, identity)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.expires_at > self._clock():
+                        self._entries.move_to_end(key)
+                        self._metrics["hits"] += 1
+                        return entry.value
+                    self._remove(key)
+                    self._metrics["expired"] += 1
+
+                flight = self._in_flight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._in_flight[key] = _InFlight()
+                    self._metrics["misses"] += 1
+                else:
+                    self._metrics["coalesced"] += 1
+
+            if leader:
+                break
+            if not flight.event.wait(remaining_timeout()):
+                raise DeadlineExceeded("Deadline exceeded while waiting for an identical query")
+            if flight.error is None:
+                return flight.value
+            if not is_timeout(flight.error):
+                raise flight.error
+            # The leader ran out of time, this call may still have some
+            check_deadline("the SQL query")
+            with self._lock:
+                self._metrics["retried"] += 1
+            logger.debug("Identical query timed out, running it again")
+
+        try:
+            flight.value = execute()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self._metrics["errors"] += 1
+            raise
+        else:
+            self._store(key, flight.value, ttl)
+            return flight.value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+    def _store(self, key: str, value: Any, ttl: float):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching result of {size} bytes, larger than the cache ({self.max_bytes} bytes)")
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _CacheEntry(value, size, self._clock() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._metrics["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def invalidate(self, table: Optional[str] = None):
+        """Drop every entry, or only the entries reading from `table`."""
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            table = table.lower()
+            for key in [k for k in self._entries if table in referenced_tables(k.split(":", 1)[1])]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["in_flight"] = len(self._in_flight)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+_cache: Optional[QueryResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_sql_result_cache() -> QueryResultCache:
+    """Return the process-wide query result cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryResultCache.from_env()
+    return _cache
@@ -0,0 +1,246 @@
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from custom_components.logger import setup_logger
+from custom_components.runtime.deadline import Deadline
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_MAX_WAIT = 10.0
+# Seed of the service time estimate used for Retry-After before any request completed
+DEFAULT_SERVICE_TIME = 5.0
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being run, answered with 429."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Too many requests ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("flow", "priority", "seq", "enqueued_at", "granted", "rejected")
+
+    def __init__(self, flow: str, priority: int, seq: int):
+        self.flow = flow
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.rejected: Optional[str] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        # Highest priority first, then first come first served
+        return (-self.priority, self.seq) < (-other.priority, other.seq)
+
+
+def worker_share(limit: int, workers: int) -> int:
+    """
+    Share of a service-wide `limit` enforced by each of `workers` processes:
+    rounded down so the service stays within it, but at least one. 0 (no
+    limit) stays 0.
+    """
+    if limit <= 0:
+        return limit
+    return max(1, limit // max(1, workers))
+
+
+class AdmissionController:
+    """
+    Bounds the number of flows running at once, globally and per flow name.
+
+    Requests over the limits wait in a bounded queue, ordered by the priority
+    of their CloudEvent source and then by arrival, for at most `max_wait`
+    seconds or what is left of their deadline. Requests that find the queue
+    full, or whose wait runs out, are rejected right away so that the ones
+    admitted still finish in time. When the queue is full a request of higher
+    priority takes the place of the lowest priority one waiting.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 flow_limits: Optional[Dict[str, int]] = None,
+                 max_queue: int = DEFAULT_MAX_QUEUE, max_wait: float = DEFAULT_MAX_WAIT,
+                 priorities: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.flow_limits = flow_limits or {}
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.priorities = priorities or {}
+        self._cond = threading.Condition()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._running_by_flow: Dict[str, int] = {}
+        self._service_time = DEFAULT_SERVICE_TIME
+        self._admitted = 0
+        self._completed = 0
+        self._shed: Dict[str, int] = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls, workers: Optional[int] = None) -> "AdmissionController":
+        """
+        Controller of one of `workers` server processes (SERVER_WORKERS, set
+        by gunicorn.conf.py, by default). The ADMISSION_* limits apply to the
+        whole service and each process gets its share of them.
+        """
+        if workers is None:
+            workers = int(os.getenv("SERVER_WORKERS", "1"))
+        flow_limits = json.loads(os.getenv("ADMISSION_FLOW_LIMITS", "{}") or "{}")
+        return cls(
+            max_concurrency=worker_share(int(os.getenv("ADMISSION_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)), workers),
+            flow_limits={flow: worker_share(int(limit), workers) for flow, limit in flow_limits.items()},
+            max_queue=worker_share(int(os.getenv("ADMISSION_MAX_QUEUE", DEFAULT_MAX_QUEUE)), workers),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT", DEFAULT_MAX_WAIT)),
+            priorities=json.loads(os.getenv("ADMISSION_PRIORITIES", "{}") or "{}"),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0 or bool(self.flow_limits)
+
+    def priority(self, source: Optional[str]) -> int:
+        return int(self.priorities.get(source or "", self.priorities.get("*", 0)))
+
+    @contextmanager
+    def admit(self, flow: str, source: Optional[str] = None,
+              deadline: Optional[Deadline] = None) -> Iterator[None]:
+        """Run the block once the request is admitted, raises AdmissionRejected if it is shed."""
+        if not self.enabled:
+            yield
+            return
+        self._acquire(flow, self.priority(source), deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(flow, time.monotonic() - started)
+
+    def _has_capacity(self, flow: str) -> bool:
+        if 0 < self.max_concurrency <= self._running:
+            return False
+        limit = self.flow_limits.get(flow, 0)
+        return not (0 < limit <= self._running_by_flow.get(flow, 0))
+
+    def _start(self, flow: str):
+        self._running += 1
+        self._running_by_flow[flow] = self._running_by_flow.get(flow, 0) + 1
+        self._admitted += 1
+
+    def _dispatch(self):
+        """Admit the queued requests that fit, in priority order. Caller holds the lock."""
+        granted = False
+        for waiter in sorted(self._waiters):
+            if self._has_capacity(waiter.flow):
+                waiter.granted = True
+                self._start(waiter.flow)
+                granted = True
+        if granted:
+            self._waiters = [w for w in self._waiters if not w.granted]
+            self._cond.notify_all()
+
+    def _shed_request(self, reason: str, flow: str) -> AdmissionRejected:
+        self._shed[reason] = self._shed.get(reason, 0) + 1
+        logger.warning(f"Shedding request for flow {flow!r}: {reason}")
+        return AdmissionRejected(reason, self.retry_after())
+
+    def _acquire(self, flow: str, priority: int, deadline: Optional[Deadline]):
+        with self._cond:
+            # Every release dispatches, so nobody queued could use a free slot
+            if self._has_capacity(flow):
+                self._start(flow)
+                self._record_wait(0.0)
+                return
+
+            if len(self._waiters) >= self.max_queue:
+                lowest = max(self._waiters) if self._waiters else None
+                if lowest is None or lowest.priority >= priority:
+                    raise self._shed_request("queue full", flow)
+                # Make room by shedding the lowest priority request waiting
+                lowest.rejected = "evicted by higher priority"
+                self._waiters.remove(lowest)
+                self._cond.notify_all()
+
+            waiter = _Waiter(flow, priority, next(self._seq))
+            self._waiters.append(waiter)
+
+            timeout = self.max_wait
+            if deadline is not None:
+                timeout = min(timeout, deadline.remaining())
+            expires_at = time.monotonic() + timeout
+            while not waiter.granted and waiter.rejected is None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    waiter.rejected = "queue timeout"
+                    self._waiters.remove(waiter)
+                    break
+                self._cond.wait(remaining)
+
+            if waiter.granted:
+                self._record_wait(time.monotonic() - waiter.enqueued_at)
+                return
+            raise self._shed_request(waiter.rejected, flow)
+
+    def _release(self, flow: str, elapsed: float):
+        with self._cond:
+            self._running -= 1
+            self._running_by_flow[flow] -= 1
+            if not self._running_by_flow[flow]:
+                del self._running_by_flow[flow]
+            self._completed += 1
+            # Exponentially weighted service time, for Retry-After
+            self._service_time += 0.2 * (elapsed - self._service_time)
+            self._dispatch()
+
+    def _record_wait(self, waited: float):
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def retry_after(self) -> int:
+        """Seconds after which the queue is expected to have drained."""
+        slots = self.max_concurrency if self.max_concurrency > 0 else max(1, self._running)
+        return max(1, math.ceil(self._service_time * (len(self._waiters) + 1) / slots))
+
+    def stats(self) -> Dict:
+        with self._cond:
+            queued_by_flow: Dict[str, int] = {}
+            for waiter in self._waiters:
+                queued_by_flow[waiter.flow] = queued_by_flow.get(waiter.flow, 0) + 1
+            return {
+                "running": self._running,
+                "running_by_flow": dict(self._running_by_flow),
+                "queued": len(self._waiters),
+                "queued_by_flow": queued_by_flow,
+                "admitted": self._admitted,
+                "completed": self._completed,
+                "shed": dict(self._shed),
+                "shed_total": sum(self._shed.values()),
+                "wait_avg_seconds": self._wait_total / self._admitted if self._admitted else 0.0,
+                "wait_max_seconds": self._wait_max,
+                "service_time_seconds": self._service_time,
+            }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Process-wide admission controller configured from the environment."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController.from_env()
+    return _controller
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_SIZE = 64
+DEFAULT_TTL = 3600.0
+
+# Components built as one of these are shared between flows and requests...
+STATELESS_BASE_CLASSES = frozenset({
+    "BaseLLM", "BaseLanguageModel", "BaseChatModel", "Embeddings", "BaseTool", "BaseRetriever",
+})
+# ...unless they also are one of these, which keep per conversation state
+STATEFUL_BASE_CLASSES = frozenset({
+    "BaseMemory", "BaseChatMemory", "BaseChatMessageHistory", "Chain", "AgentExecutor",
+})
+STATEFUL_BASE_TYPES = frozenset({"memories", "chains", "agents"})
+
+
+class _Entry:
+    __slots__ = ("component", "component_type", "refs", "last_used")
+
+    def __init__(self, component: Any, component_type: str):
+        self.component = component
+        self.component_type = component_type
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class _TypeStats:
+    __slots__ = ("hits", "misses", "evictions")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class _Stateful(Exception):
+    """A component is built from a stateful one and cannot be pooled."""
+
+
+def _is_vertex(value: Any) -> bool:
+    return hasattr(value, "vertex_type") and hasattr(value, "params")
+
+
+class ComponentPool:
+    """
+    Instances of the stateless components of the flows (LLMs, embeddings,
+    tools, retrievers), keyed by component type and a hash of the resolved
+    parameters, including the code of custom components and the keys of the
+    components they are built from. Flows built from the same building
+    blocks share one instance, with its HTTP session and clients, across
+    flows and requests.
+
+    Memories, chains and agents are never pooled, nor is anything built from
+    them. Entries referenced by a running flow are kept; the others are
+    evicted least recently used first above `max_size` or after `ttl`
+    seconds unused.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: float = DEFAULT_TTL,
+                 exclude: Iterable[str] = ()):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.exclude = frozenset(exclude)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._stats: Dict[str, _TypeStats] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ComponentPool":
+        exclude = [t.strip() for t in os.getenv("COMPONENT_POOL_EXCLUDE", "").split(",") if t.strip()]
+        return cls(
+            max_size=int(os.getenv("COMPONENT_POOL_MAX_SIZE", DEFAULT_MAX_SIZE)),
+            ttl=float(os.getenv("COMPONENT_POOL_TTL", DEFAULT_TTL)),
+            exclude=exclude,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def is_stateless(self, vertex) -> bool:
+        base_classes = set(vertex.output or ())
+        return (
+            vertex.vertex_type not in self.exclude
+            and vertex.base_type not in STATEFUL_BASE_TYPES
+            and bool(base_classes & STATELESS_BASE_CLASSES)
+            and not base_classes & STATEFUL_BASE_CLASSES
+        )
+
+    def key(self, vertex, _memo: Optional[Dict[str, Optional[str]]] = None) -> Optional[str]:
+        """Pool key of `vertex`, None if it or a component it is built from is stateful."""
+        memo = {} if _memo is None else _memo
+        if vertex.id in memo:
+            return memo[vertex.id]
+        memo[vertex.id] = None
+        if not self.is_stateless(vertex):
+            return None
+
+        def canonical(value):
+            if _is_vertex(value):
+                child = self.key(value, memo)
+                if child is None:
+                    raise _Stateful()
+                return {"component": child}
+            if isinstance(value, dict):
+                return {str(k): canonical(v) for k, v in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [canonical(v) for v in value]
+            return value
+
+        try:
+            params = canonical(vertex.params)
+        except _Stateful:
+            return None
+        payload = json.dumps({"type": vertex.vertex_type, "params": params}, sort_keys=True, default=repr)
+        memo[vertex.id] = f"{vertex.vertex_type}:{hashlib.sha256(payload.encode()).hexdigest()}"
+        return memo[vertex.id]
+
+    def acquire(self, key: str, component_type: str) -> Optional[Any]:
+        """The pooled instance for `key` with a reference taken on it, None on a miss."""
+        with self._lock:
+            stats = self._stats.setdefault(component_type, _TypeStats())
+            entry = self._entries.get(key)
+            if entry is None:
+                stats.misses += 1
+                return None
+            stats.hits += 1
+            entry.refs += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+            return entry.component
+
+    def add(self, key: str, component_type: str, component: Any) -> bool:
+        """
+        Pool `component` with a reference taken on it. Returns False if an
+        instance was pooled for `key` concurrently, `component` then stays
+        private to its flow.
+        """
+        with self._lock:
+            if key in self._entries:
+                return False
+            entry = self._entries[key] = _Entry(component, component_type)
+            entry.refs = 1
+            self._evict()
+            return True
+
+    def release(self, keys: Iterable[str]):
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs -= 1
+                    entry.last_used = now
+            self._evict()
+
+    def _evict(self):
+        """Drop unreferenced entries that expired or exceed max_size. Caller holds the lock."""
+        now = time.monotonic()
+        excess = len(self._entries) - self.max_size
+        for key, entry in list(self._entries.items()):
+            if entry.refs > 0:
+                continue
+            if excess > 0 or now - entry.last_used > self.ttl:
+                del self._entries[key]
+                self._stats.setdefault(entry.component_type, _TypeStats()).evictions += 1
+                excess -= 1
+                logger.debug(f"Evicted pooled {entry.component_type} {key}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            types: Dict[str, Dict[str, int]] = {}
+            for name, stats in self._stats.items():
+                types[name] = {"entries": 0, "refs": 0, "hits": stats.hits,
+                               "misses": stats.misses, "evictions": stats.evictions}
+            for entry in self._entries.values():
+                counts = types.setdefault(entry.component_type, {"entries": 0, "refs": 0, "hits": 0,
+                                                                 "misses": 0, "evictions": 0})
+                counts["entries"] += 1
+                counts["refs"] += entry.refs
+            return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl, "types": types}
+
+    def prime(self, vertices: Iterable) -> Dict[str, str]:
+        """
+        Mark the vertices that have a pooled instance as built with it.
+        Returns the pool keys of the stateless vertices by vertex id.
+        """
+        memo: Dict[str, Optional[str]] = {}
+        keys: Dict[str, str] = {}
+        for vertex in vertices:
+            key = self.key(vertex, memo)
+            if key is None:
+                continue
+            keys[vertex.id] = key
+            component = self.acquire(key, vertex.vertex_type)
+            if component is not None:
+                vertex._built_object = component
+                vertex._built = True
+        return keys
+
+    @contextmanager
+    def load_flow(self, flow: dict, tweaks: Optional[dict] = None) -> Iterator[Any]:
+        """
+        Build `flow` like langflow.load_flow_from_json, reusing the pooled
+        stateless components, and release them when the block exits.
+        """
+        from langflow import load_flow_from_json
+        from langflow.processing.process import fix_memory_inputs
+
+        if not self.enabled:
+            yield load_flow_from_json(flow, tweaks=tweaks)
+            return
+
+        graph = load_flow_from_json(flow, tweaks=tweaks, build=False)
+        vertices = list(graph.vertices)
+        keys = self.prime(vertices)
+        held: List[str] = [key for vertex_id, key in keys.items()
+                           if getattr(graph.get_vertex(vertex_id), "_built", False)]
+        try:
+            langchain_object = asyncio.run(graph.build())
+            for vertex in vertices:
+                key = keys.get(vertex.id)
+                if key is not None and key not in held and vertex._built:
+                    if self.add(key, vertex.vertex_type, vertex._built_object):
+                        held.append(key)
+
+            # Same finishing touches as load_flow_from_json
+            if hasattr(langchain_object, "verbose"):
+                langchain_object.verbose = True
+            if hasattr(langchain_object, "return_intermediate_steps"):
+                langchain_object.return_intermediate_steps = False
+            fix_memory_inputs(langchain_object)
+            yield langchain_object
+        finally:
+            self.release(held)
+
+
+_pool: Optional[ComponentPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_component_pool() -> ComponentPool:
+    """Process-wide component pool configured from the environment."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ComponentPool.from_env()
+    return _pool
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Iterator, Mapping, Optional
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_FLOW_TIMEOUT = 300.0
+# CloudEvent extension attribute holding an RFC 3339 deadline (Ce-Deadline
+# header in binary mode) and plain HTTP header holding a timeout in seconds.
+DEADLINE_EXTENSION = "deadline"
+TIMEOUT_HEADER = "X-Request-Timeout"
+# A transport timeout set from remaining_timeout() can fire this much before
+# the deadline itself, it is still the deadline that cut the call short.
+TIMEOUT_GRACE = 0.05
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the request's time budget ran out before the work was done."""
+
+
+class Deadline:
+    """
+    Point in time by which a request has to be answered, on the monotonic
+    clock so wall-clock adjustments cannot stretch or shrink the budget.
+    """
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        # Set when the work stopped at the deadline with a partial result
+        self.stopped_early = False
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def at(cls, timestamp: float) -> "Deadline":
+        """Deadline at the unix `timestamp`."""
+        return cls.after(timestamp - time.time())
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = "request"):
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline exceeded before {what} could complete")
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.3f}s)"
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being processed, if any."""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Make `deadline` the current deadline for the duration of the block."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def remaining_timeout(default: Optional[float] = None) -> Optional[float]:
+    """
+    Time left for the current request, to be used as the timeout of an
+    outgoing call. Raises DeadlineExceeded if there is none left and returns
+    `default` outside of a request.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    deadline.check("the next call")
+    remaining = deadline.remaining()
+    return min(remaining, default) if default is not None else remaining
+
+
+def check_deadline(what: str = "request"):
+    """Raise DeadlineExceeded if the current request is out of time."""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(what)
+
+
+@contextmanager
+def deadline_errors(what: str = "request") -> Iterator[None]:
+    """
+    Report the failure of an outgoing call bounded by remaining_timeout() as
+    DeadlineExceeded when the request is out of time, so a read timeout of
+    requests or a Flight SQL rpc timeout is handled like any other deadline.
+    Errors raised while there is time left propagate unchanged.
+    """
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        deadline = current_deadline()
+        if deadline is not None and deadline.remaining() <= TIMEOUT_GRACE:
+            raise DeadlineExceeded(f"Deadline exceeded before {what} could complete: {e}") from e
+        raise
+
+
+def flow_timeout(flow_name: str) -> float:
+    """
+    Default time budget of a flow: FLOW_TIMEOUTS (a JSON object of flow name
+    to seconds) or else FLOW_TIMEOUT.
+    """
+    timeouts = json.loads(os.getenv("FLOW_TIMEOUTS", "{}") or "{}")
+    if flow_name in timeouts:
+        return float(timeouts[flow_name])
+    return float(os.getenv("FLOW_TIMEOUT", DEFAULT_FLOW_TIMEOUT))
+
+
+def deadline_for_request(headers: Mapping[str, str], event, flow_name: str) -> Deadline:
+    """
+    Deadline of a request: the earliest of the CloudEvent `deadline`
+    extension, the X-Request-Timeout header and the flow's default timeout.
+    """
+    deadline = Deadline.after(flow_timeout(flow_name))
+
+    requested = event.get(DEADLINE_EXTENSION) if event is not None else None
+    if requested:
+        try:
+            timestamp = datetime.fromisoformat(str(requested).replace("Z", "+00:00")).timestamp()
+            deadline = min(deadline, Deadline.at(timestamp), key=lambda d: d.expires_at)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {DEADLINE_EXTENSION} extension: {requested}")
+
+    timeout = headers.get(TIMEOUT_HEADER)
+    if timeout:
+        try:
+            deadline = min(deadline, Deadline.after(float(timeout)), key=lambda d: d.expires_at)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {TIMEOUT_HEADER} header: {timeout}")
+    return deadline
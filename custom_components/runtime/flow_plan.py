@@ -0,0 +1,330 @@
+import hashlib
+import json
+import sys
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PLAN_VERSION = 2
+
+# Template field attributes langflow reads when building a graph
+RUNTIME_FIELD_KEYS = ("type", "required", "list", "show", "value", "file_path", "input_types", "default")
+
+
+class PlanNotSupported(ValueError):
+    """The flow cannot be compiled to a plan, e.g. it contains grouped components."""
+
+
+# Errors of a plan that cannot be compiled, decoded or expanded, e.g. a
+# component source missing from the side table. The flow then runs from its
+# editor document, database errors are not among them.
+PLAN_ERRORS = (KeyError, TypeError, ValueError)
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def _topological_order(node_ids: List[str], edges: List[dict]) -> List[str]:
+    """Node ids with every node after the nodes it is built from, stable otherwise."""
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+    incoming = {node_id: 0 for node_id in node_ids}
+    targets: Dict[str, List[str]] = {node_id: [] for node_id in node_ids}
+    for edge in edges:
+        source, target = edge["source"], edge["target"]
+        if source not in position or target not in position:
+            raise PlanNotSupported(f"Edge {source} -> {target} references an unknown node")
+        targets[source].append(target)
+        incoming[target] += 1
+
+    ready = [node_id for node_id in node_ids if not incoming[node_id]]
+    order = []
+    while ready:
+        ready.sort(key=position.get)
+        node_id = ready.pop(0)
+        order.append(node_id)
+        for target in targets[node_id]:
+            incoming[target] -= 1
+            if not incoming[target]:
+                ready.append(target)
+    if len(order) != len(node_ids):
+        raise PlanNotSupported("The flow contains a cycle")
+    return order
+
+
+def compile_flow(data: dict) -> Tuple[dict, Dict[str, str]]:
+    """
+    Compile the `data` of a stored flow (the editor document with positions,
+    display metadata and component sources) to an execution plan: the nodes
+    in build order with only the parameters langflow reads, and the code of
+    custom components referenced by hash. Returns the plan and the code by
+    hash.
+    """
+    nodes = data.get("nodes") or []
+    edges = data.get("edges") or []
+    code: Dict[str, str] = {}
+
+    compiled = {}
+    for node in nodes:
+        node_data = node["data"]
+        if node_data["node"].get("flow"):
+            raise PlanNotSupported(f"Grouped component {node['id']} is not supported")
+        params = {}
+        code_ref = None
+        for name, field in node_data["node"]["template"].items():
+            if not isinstance(field, dict):
+                continue
+            if field.get("type") == "code" and name == "code" and field.get("value"):
+                code_ref = code_hash(field["value"])
+                code[code_ref] = field["value"]
+                continue
+            # Hidden fields keep their value too, langflow passes it to build()
+            params[name] = {key: field[key] for key in RUNTIME_FIELD_KEYS if key in field}
+        compiled[node["id"]] = {
+            "id": node["id"],
+            "type": node_data["type"],
+            "template_type": node_data["node"]["template"].get("_type"),
+            "base_classes": node_data["node"]["base_classes"],
+            "params": params,
+            "code": code_ref,
+        }
+
+    plan_edges = []
+    for edge in edges:
+        handles = edge.get("data") or {}
+        source_handle, target_handle = handles.get("sourceHandle", {}), handles.get("targetHandle", {})
+        plan_edges.append({
+            "source": edge["source"],
+            "target": edge["target"],
+            "field": target_handle.get("fieldName"),
+            "type": target_handle.get("type"),
+            "input_types": target_handle.get("inputTypes"),
+            "source_classes": source_handle.get("baseClasses", []),
+            "source_type": source_handle.get("dataType"),
+        })
+
+    order = _topological_order([node["id"] for node in nodes], edges)
+    plan = {"version": PLAN_VERSION, "nodes": [compiled[node_id] for node_id in order], "edges": plan_edges}
+    return plan, code
+
+
+def plan_code_hashes(plan: dict) -> List[str]:
+    return sorted({node["code"] for node in plan["nodes"] if node.get("code")})
+
+
+def expand_plan(plan: dict, code: Callable[[str], str]) -> dict:
+    """
+    The langflow graph document of `plan`, with the component sources
+    looked up by hash with `code`. Accepted by load_flow_from_json and
+    langflow's tweaks, which still build the graph from it: the plan makes
+    the document smaller, not the build.
+    """
+    nodes = []
+    for node in plan["nodes"]:
+        template: Dict[str, Any] = {name: dict(field) for name, field in node["params"].items()}
+        if node.get("code"):
+            template["code"] = {"type": "code", "required": True, "list": False, "show": True,
+                                "value": code(node["code"])}
+        template["_type"] = node["template_type"]
+        nodes.append({
+            "id": node["id"],
+            "data": {
+                "id": node["id"],
+                "type": node["type"],
+                "node": {"base_classes": node["base_classes"], "template": template},
+            },
+        })
+    edges = []
+    for edge in plan["edges"]:
+        edges.append({
+            "source": edge["source"],
+            "target": edge["target"],
+            "data": {
+                "sourceHandle": {"baseClasses": edge["source_classes"], "dataType": edge["source_type"],
+                                 "id": edge["source"]},
+                "targetHandle": {"fieldName": edge["field"], "id": edge["target"],
+                                 "inputTypes": edge["input_types"], "type": edge["type"]},
+            },
+        })
+    return {"nodes": nodes, "edges": edges}
+
+
+class CodeCache:
+    """
+    Component sources by hash, and the component classes langflow compiles
+    from them so each source is only executed once per process.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, str] = {}
+        self._classes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        return self._sources.get(digest)
+
+    def update(self, sources: Dict[str, str]):
+        with self._lock:
+            self._sources.update(sources)
+
+    def missing(self, digests: Iterable[str]) -> List[str]:
+        return [digest for digest in digests if digest not in self._sources]
+
+    def __getitem__(self, digest: str) -> str:
+        try:
+            return self._sources[digest]
+        except KeyError:
+            raise KeyError(f"Component code {digest} is not available") from None
+
+    def compiled(self, code: str, compile: Callable[[str], Any]) -> Any:
+        digest = code_hash(code)
+        component_class = self._classes.get(digest)
+        if component_class is None:
+            component_class = compile(code)
+            with self._lock:
+                self._classes[digest] = component_class
+        return component_class
+
+    def stats(self) -> Dict[str, int]:
+        return {"sources": len(self._sources), "compiled": len(self._classes)}
+
+
+_code_cache = CodeCache()
+_installed = False
+_install_lock = threading.Lock()
+
+
+def get_code_cache() -> CodeCache:
+    return _code_cache
+
+
+def install_compiled_code_cache():
+    """
+    Make langflow reuse the component class compiled from a source instead
+    of executing the source again for every build of a custom component.
+
+    langflow modules import eval_custom_component_code by name, so the name
+    is rebound in every loaded langflow module holding it, the module that
+    defines it included for the modules imported later.
+    """
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        from langflow.interface.initialize import loading
+
+        eval_code = loading.eval_custom_component_code
+
+        def cached_eval_code(code: str):
+            return _code_cache.compiled(code, eval_code)
+
+        patched = []
+        for name, module in list(sys.modules.items()):
+            if name.split(".")[0] == "langflow" and getattr(module, "eval_custom_component_code", None) is eval_code:
+                module.eval_custom_component_code = cached_eval_code
+                patched.append(name)
+        logger.debug(f"Compiled component code cache installed in {patched}")
+        _installed = True
+
+
+class FlowPlanStore:
+    """
+    Plans stored in the `flow_plan` side table of the langflow database, next
+    to the sources in `flow_component_code`. A plan is keyed by flow id and
+    the md5 of the flow data computed by the database, so a changed flow is
+    recompiled on its next fetch without transferring the data otherwise.
+    """
+
+    def __init__(self, engine, flow_table):
+        from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table, Text, func
+        from sqlalchemy.dialects.postgresql import UUID
+
+        self.engine = engine
+        self.flow_table = flow_table
+        self.metadata = MetaData()
+        self.plan_table = Table(
+            "flow_plan",
+            self.metadata,
+            Column("flow_id", UUID(as_uuid=True), primary_key=True, nullable=False),
+            Column("source_hash", String(32), nullable=False),
+            Column("version", Integer, nullable=False),
+            Column("plan", JSON, nullable=False),
+            Column("compiled_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+        )
+        self.code_table = Table(
+            "flow_component_code",
+            self.metadata,
+            Column("hash", String(64), primary_key=True, nullable=False),
+            Column("code", Text, nullable=False),
+        )
+
+    def create_tables(self):
+        """
+        Create the side tables, a deployment step (create_flow_plan_tables.py)
+        rather than something done on the request path.
+        """
+        self.metadata.create_all(self.engine, checkfirst=True)
+
+    def fetch(self, session, name: str) -> Optional[dict]:
+        """
+        The flow record `name` with its plan in place of the editor document,
+        compiling and storing the plan if it is missing or stale. None if
+        there is no such flow.
+        """
+        from sqlalchemy import Text, and_, cast, func, select
+
+        flow, plan = self.flow_table, self.plan_table
+        source_hash = func.md5(cast(flow.c.data, Text))
+        row = session.execute(
+            select(flow.c.id, flow.c.user_id, flow.c.name, source_hash.label("source_hash"), plan.c.plan)
+            .select_from(flow.outerjoin(plan, and_(
+                plan.c.flow_id == flow.c.id,
+                plan.c.source_hash == source_hash,
+                plan.c.version == PLAN_VERSION,
+            )))
+            .where(flow.c.name == name)
+            .limit(1)
+        ).first()
+        if row is None:
+            return None
+
+        compiled_plan = row.plan
+        if compiled_plan is None:
+            data = session.execute(select(flow.c.data).where(flow.c.id == row.id)).scalar_one()
+            compiled_plan, sources = compile_flow(data)
+            self.save(session, row.id, row.source_hash, compiled_plan, sources)
+            _code_cache.update(sources)
+            logger.info(f"Compiled the plan of flow {name!r}: {len(json.dumps(data))} -> "
+                        f"{len(json.dumps(compiled_plan))} bytes")
+
+        missing = _code_cache.missing(plan_code_hashes(compiled_plan))
+        if missing:
+            code = self.code_table
+            rows = session.execute(select(code.c.hash, code.c.code).where(code.c.hash.in_(missing))).all()
+            _code_cache.update({digest: source for digest, source in rows})
+
+        return {"id": row.id, "user_id": row.user_id, "name": row.name, "plan": compiled_plan}
+
+    def save(self, session, flow_id, source_hash: str, plan: dict, sources: Dict[str, str]):
+        from sqlalchemy import func
+        from sqlalchemy.dialects.postgresql import insert
+
+        if sources:
+            session.execute(
+                insert(self.code_table)
+                .values([{"hash": digest, "code": source} for digest, source in sources.items()])
+                .on_conflict_do_nothing()
+            )
+        statement = insert(self.plan_table).values(
+            flow_id=flow_id, source_hash=source_hash, version=PLAN_VERSION, plan=plan)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[self.plan_table.c.flow_id],
+            set_={"source_hash": statement.excluded.source_hash, "version": statement.excluded.version,
+                  "plan": statement.excluded.plan, "compiled_at": func.now()},
+        ))
+        session.commit()
@@ -0,0 +1,115 @@
+import gc
+import importlib
+import math
+import os
+import time
+from typing import Iterable, List, Optional
+
+from custom_components.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Imported in the gunicorn master so every worker shares them copy-on-write,
+# func.py and the DPN tools themselves only import these on first use
+DEFAULT_PRELOAD_MODULES = (
+    "cloudevents.http",
+    "sqlalchemy.orm",
+    "langflow",
+    "langchain.agents",
+    "langchain_community.utilities.sql_database",
+    "custom_components.custom_langchain_components.seldon_wrapper",
+    "custom_components.custom_langchain_components.dpn_bucket_tool",
+    "custom_components.custom_langchain_components.custom_memory_buffer",
+    "custom_components.custom_langchain_components.custom_prompt",
+    "custom_components.custom_langchain_components.json_agent_output_parser",
+    "custom_components.custom_langchain_components.concurrent_agent_executor",
+)
+
+
+def split_env_list(name: str, default: Iterable[str] = ()) -> List[str]:
+    value = os.getenv(name)
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def preload_modules(names: Iterable[str]) -> List[str]:
+    """Import `names`, skipping the ones that fail. Returns the imported module names."""
+    loaded = []
+    for name in names:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Could not preload {name}: {type(e).__name__} - {e}")
+            continue
+        loaded.append(name)
+        logger.info(f"Preloaded {name} in {time.perf_counter() - started:.3f}s")
+    return loaded
+
+
+def warm_flows(func, names: Iterable[str]) -> List[str]:
+    """
+    Pin the flow definitions `names` in the function's flow cache. They do not
+    expire while refreshed in the background, so the forked workers serve
+    them without fetching them again.
+    """
+    warmed = []
+    for name in names:
+        record = func.pin_flow(name)
+        if isinstance(record, tuple):
+            logger.warning(f"Could not warm flow {name}: {record[0].get('error')}")
+            continue
+        warmed.append(name)
+    return warmed
+
+
+def freeze_gc():
+    """
+    Move everything allocated so far to the permanent generation so the
+    garbage collector of the workers does not touch, and thereby copy, the
+    pages inherited from the master.
+    """
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def cpu_limit() -> int:
+    """CPUs available to the container, honouring a cgroup v2 CPU quota."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def worker_layout(container_concurrency: int, workers: Optional[int] = None,
+                  threads: Optional[int] = None, default_threads: int = 4):
+    """
+    Number of worker processes and threads per worker for a Knative
+    `containerConcurrency` (0 meaning unlimited): one process per CPU at most,
+    and enough threads for workers * threads to cover the concurrency.
+    """
+    cpus = cpu_limit()
+    if not workers:
+        workers = min(cpus, container_concurrency) if container_concurrency > 0 else cpus
+    if not threads:
+        threads = math.ceil(container_concurrency / workers) if container_concurrency > 0 else default_threads
+    return max(1, workers), max(1, threads)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # Peak RSS, in KiB on Linux, is the best we have without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,76 @@
+# Production server configuration, see "Production serving" in the README.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app, the heavy dependencies, the custom components and the flows listed
+# in PRELOAD_FLOWS are loaded once in the master and shared copy-on-write by
+# the forked workers, which refresh those flows every FLOW_CACHE_TTL seconds.
+# Workers are recycled after WORKER_MAX_REQUESTS requests or once their memory
+# exceeds WORKER_MAX_RSS_MB.
+import os
+
+from custom_components.runtime.preload import (
+    DEFAULT_PRELOAD_MODULES,
+    freeze_gc,
+    preload_modules,
+    rss_bytes,
+    split_env_list,
+    warm_flows,
+    worker_layout,
+)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+workers, threads = worker_layout(
+    container_concurrency=int(os.getenv("CONTAINER_CONCURRENCY", "0")),
+    workers=int(os.getenv("WEB_WORKERS", "0")),
+    threads=int(os.getenv("WEB_THREADS", "0")),
+)
+worker_class = "gthread"
+# The workers split the service-wide admission limits between them
+os.environ["SERVER_WORKERS"] = str(workers)
+
+preload_app = True
+
+max_requests = int(os.getenv("WORKER_MAX_REQUESTS", "1000"))
+max_requests_jitter = max(1, max_requests // 10)
+max_rss_bytes = int(os.getenv("WORKER_MAX_RSS_MB", "0")) * 1024 * 1024
+
+# Outlive the longest flow so requests are cut by their deadline, not by gunicorn
+timeout = int(float(os.getenv("FLOW_TIMEOUT", "300"))) + 30
+graceful_timeout = timeout
+keepalive = 5
+
+accesslog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    preload_modules(split_env_list("PRELOAD_MODULES", DEFAULT_PRELOAD_MODULES))
+    server.log.info(f"Serving with {workers} workers x {threads} threads")
+
+
+def when_ready(server):
+    # Runs after the app (and with it func.py) has been loaded in the master
+    import func
+
+    flows = split_env_list("PRELOAD_FLOWS")
+    if flows:
+        server.log.info(f"Warmed flows: {warm_flows(func, flows)}")
+    # Connections opened in the master must not be shared with the workers
+    func.dispose_engine()
+    freeze_gc()
+
+
+def post_fork(server, worker):
+    import func
+
+    func.dispose_engine(close=False)
+    # The flows warmed in the master are refreshed by each worker
+    func.start_flow_refresher()
+
+
+def post_request(worker, req, environ, resp):
+    if max_rss_bytes and rss_bytes() > max_rss_bytes:
+        worker.log.info(f"Worker {worker.pid} exceeds WORKER_MAX_RSS_MB, recycling")
+        worker.alive = False
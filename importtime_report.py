@@ -0,0 +1,89 @@
+"""
+Cold import profile of the runtime: imports a module in a fresh interpreter
+with `python -X importtime` and prints the slowest imports as a table.
+
+    python importtime_report.py func
+    python importtime_report.py custom_components.components.tools.SQLTool --top 40 --sort self
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, NamedTuple
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def run_importtime(code: str, cwd: str) -> str:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise ImportError(f"Running {code!r} failed:\n{completed.stderr[-2000:]}")
+    return completed.stderr
+
+
+def measure(module: str, cwd: str = None) -> List[ImportTime]:
+    """
+    Import `module` in a new interpreter and return the time spent on every
+    import it caused, leaving out the ones done by the interpreter startup.
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    startup = {e.module for e in parse(run_importtime("pass", cwd))}
+    return [e for e in parse(run_importtime(f"import {module}", cwd)) if e.module not in startup]
+
+
+def parse(output: str) -> List[ImportTime]:
+    """Parse the `-X importtime` lines, e.g. `import time:  120 |  4512 |   json`."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # Header line
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip()
+        depth = (len(name) - len(stripped)) // 2
+        entries.append(ImportTime(stripped, int(fields[0]), int(fields[1]), depth))
+    return entries
+
+
+def total_ms(entries: List[ImportTime]) -> float:
+    """Time of the whole import: the sum over the top level imports."""
+    return sum(e.cumulative_us for e in entries if e.depth == 0) / 1000
+
+
+def imported(entries: List[ImportTime]) -> set:
+    return {e.module for e in entries}
+
+
+def format_table(entries: List[ImportTime], top: int = 25, sort: str = "cumulative") -> str:
+    key = (lambda e: e.self_us) if sort == "self" else (lambda e: e.cumulative_us)
+    rows = sorted(entries, key=key, reverse=True)[:top]
+    width = max([len("module")] + [len(e.module) for e in rows])
+    lines = [f"{'module':<{width}}  {'self ms':>9}  {'cumulative ms':>13}", "-" * (width + 26)]
+    for e in rows:
+        lines.append(f"{e.module:<{width}}  {e.self_us / 1000:>9.1f}  {e.cumulative_us / 1000:>13.1f}")
+    lines.append(f"{len(entries)} modules imported in {total_ms(entries):.1f} ms")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default="func")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--sort", choices=("cumulative", "self"), default="cumulative")
+    args = parser.parse_args()
+    print(format_table(measure(args.module), args.top, args.sort))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import runpy
+import threading
+import time
+import unittest
+from unittest import mock
+
+from custom_components.runtime.admission import AdmissionController, AdmissionRejected
+from custom_components.runtime.deadline import Deadline
+
+
+class Holder:
+  """Holds an admission slot on a thread until released."""
+
+  def __init__(self, controller, flow, source=None):
+    self.admitted = threading.Event()
+    self.done = threading.Event()
+    self.error = None
+    self.thread = threading.Thread(target=self.run, args=(controller, flow, source), daemon=True)
+    self.thread.start()
+
+  def run(self, controller, flow, source):
+    try:
+      with controller.admit(flow, source):
+        self.admitted.set()
+        self.done.wait(5)
+    except AdmissionRejected as e:
+      self.error = e
+
+  def release(self):
+    self.done.set()
+    self.thread.join(5)
+
+
+def wait_for(predicate, timeout=2):
+  stop = time.monotonic() + timeout
+  while not predicate() and time.monotonic() < stop:
+    time.sleep(0.005)
+  return predicate()
+
+
+class TestAdmissionController(unittest.TestCase):
+
+  def test_global_limit_queues_then_admits(self):
+    controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait=2)
+    first = Holder(controller, "a")
+    self.assertTrue(first.admitted.wait(1))
+    second = Holder(controller, "a")
+    self.assertTrue(wait_for(lambda: controller.stats()["queued"] == 1))
+    self.assertFalse(second.admitted.is_set())
+    first.release()
+    self.assertTrue(second.admitted.wait(1))
+    second.release()
+    stats = controller.stats()
+    self.assertEqual((stats["admitted"], stats["completed"], stats["running"]), (2, 2, 0))
+    self.assertGreater(stats["wait_max_seconds"], 0)
+
+  def test_per_flow_limit(self):
+    controller = AdmissionController(max_concurrency=4, flow_limits={"sql": 1}, max_queue=0, max_wait=1)
+    sql = Holder(controller, "sql")
+    self.assertTrue(sql.admitted.wait(1))
+    other = Holder(controller, "s3")
+    self.assertTrue(other.admitted.wait(1))
+    with self.assertRaises(AdmissionRejected) as rejected:
+      with controller.admit("sql"):
+        pass
+    self.assertEqual(rejected.exception.reason, "queue full")
+    self.assertGreaterEqual(rejected.exception.retry_after, 1)
+    sql.release()
+    other.release()
+    self.assertEqual(controller.stats()["shed"], {"queue full": 1})
+
+  def test_queue_timeout_and_deadline(self):
+    controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait=0.05)
+    first = Holder(controller, "a")
+    self.assertTrue(first.admitted.wait(1))
+    with self.assertRaises(AdmissionRejected):
+      with controller.admit("a"):
+        pass
+    controller.max_wait = 10
+    started = time.monotonic()
+    with self.assertRaises(AdmissionRejected):
+      with controller.admit("a", deadline=Deadline.after(0.05)):
+        pass
+    self.assertLess(time.monotonic() - started, 1)
+    first.release()
+    self.assertEqual(controller.stats()["shed"], {"queue timeout": 2})
+
+  def test_priority(self):
+    controller = AdmissionController(max_concurrency=1, max_queue=1, max_wait=2, priorities={"gold": 10})
+    first = Holder(controller, "a")
+    self.assertTrue(first.admitted.wait(1))
+    low = Holder(controller, "a", source="batch")
+    self.assertTrue(wait_for(lambda: controller.stats()["queued"] == 1))
+    high = Holder(controller, "a", source="gold")
+    # The queue is full, the high priority request takes the low one's place
+    low.thread.join(1)
+    self.assertEqual(low.error.reason, "evicted by higher priority")
+    first.release()
+    self.assertTrue(high.admitted.wait(1))
+    high.release()
+
+  def test_disabled(self):
+    controller = AdmissionController(max_concurrency=0)
+    with controller.admit("a"), controller.admit("a"):
+      pass
+    self.assertEqual(controller.stats()["admitted"], 0)
+
+  def test_limits_split_across_workers(self):
+    env = {
+      "ADMISSION_MAX_CONCURRENCY": "8", "ADMISSION_FLOW_LIMITS": '{"a": 4, "b": 1, "c": 0}',
+      "ADMISSION_MAX_QUEUE": "16", "SERVER_WORKERS": "3",
+    }
+    with mock.patch.dict(os.environ, env):
+      controller = AdmissionController.from_env()
+      single = AdmissionController.from_env(workers=1)
+    self.assertEqual(controller.max_concurrency, 2)
+    self.assertEqual(controller.flow_limits, {"a": 1, "b": 1, "c": 0})
+    self.assertEqual(controller.max_queue, 5)
+    self.assertEqual((single.max_concurrency, single.max_queue), (8, 16))
+
+    with mock.patch.dict(os.environ, {"ADMISSION_MAX_CONCURRENCY": "0", "ADMISSION_FLOW_LIMITS": "{}", "SERVER_WORKERS": "3"}):
+      self.assertFalse(AdmissionController.from_env().enabled)
+
+  def test_gunicorn_sets_worker_count(self):
+    env = {"CONTAINER_CONCURRENCY": "8", "WEB_WORKERS": "4", "WEB_THREADS": "0", "ADMISSION_MAX_CONCURRENCY": "8"}
+    with mock.patch.dict(os.environ, env):
+      config = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py"))
+      self.assertEqual(config["workers"], 4)
+      self.assertEqual(os.environ["SERVER_WORKERS"], "4")
+      self.assertEqual(AdmissionController.from_env().max_concurrency, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
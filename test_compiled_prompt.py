@@ -0,0 +1,154 @@
+import importlib.util
+import unittest
+
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+from custom_components.custom_langchain_components.compiled_prompt import (
+  LLAMA2,
+  ZEPHYR,
+  CompiledTemplate,
+  TokenCounter,
+  family_of,
+  get_prompt_metrics,
+  model_family,
+  trim_to_tokens,
+)
+
+LANGCHAIN = importlib.util.find_spec("langchain") is not None
+
+# One token per character keeps the budgets below easy to follow
+COUNTER = TokenCounter(chars_per_token=1)
+
+
+class TestCompiledPrompt(unittest.TestCase):
+
+  def test_static_fields_prerendered(self):
+    compiled = CompiledTemplate("{pre_prompt}\n{history}\nQ: {input} {{literal}}", {"pre_prompt": "Be brief."}, COUNTER)
+    self.assertEqual(compiled.slots, ("history", "input"))
+    self.assertEqual(compiled.static_tokens, len("Be brief.\n\nQ:  {literal}"))
+    rendered = compiled.render(history="hi", input="why?")
+    self.assertEqual(rendered, "Be brief.\nhi\nQ: why? {literal}")
+    self.assertEqual(rendered, "{pre_prompt}\n{history}\nQ: {input} {{literal}}".format(
+      pre_prompt="Be brief.", history="hi", input="why?"))
+
+  def test_budget_trims_history_then_context(self):
+    compiled = CompiledTemplate("{context}|{history}|{input}", counter=COUNTER)
+    history = "turn 1\nturn 2\nturn 3"
+    context = "section 1\nsection 2"
+    full = compiled.render(context=context, history=history, input="q")
+    self.assertEqual(compiled.render(budget=len(full), context=context, history=history, input="q"), full)
+
+    # The oldest turns go first
+    rendered = compiled.render(budget=len(full) - 7, context=context, history=history, input="q")
+    self.assertEqual(rendered, "section 1\nsection 2|turn 2\nturn 3|q")
+
+    # Then the last sections of the context
+    rendered = compiled.render(budget=len("section 1") + 4, context=context, history=history, input="q")
+    self.assertEqual(rendered, "section 1||q")
+
+  def test_budget_trims_oldest_scratchpad_steps(self):
+    compiled = CompiledTemplate("{input}\n{agent_scratchpad}", counter=COUNTER)
+    steps = ["action 1\nObservation: result 1\nThought: ", "action 2\nObservation: result 2\nThought: "]
+    scratchpad = "".join(steps)
+    full = compiled.render(input="q", agent_scratchpad=scratchpad)
+    rendered = compiled.render(budget=len(full) - 1, input="q", agent_scratchpad=scratchpad)
+    self.assertEqual(rendered, "q\n" + steps[1])
+
+  def test_over_budget_counted(self):
+    compiled = CompiledTemplate("{context} {input}", counter=COUNTER)
+    before = get_prompt_metrics()
+    rendered = compiled.render(budget=3, context="", input="a long question")
+    self.assertEqual(rendered, " a long question")
+    after = get_prompt_metrics()
+    self.assertEqual(after["over_budget"], before["over_budget"] + 1)
+    self.assertEqual(after["renders"], before["renders"] + 1)
+
+  def test_trim_to_tokens(self):
+    self.assertEqual(trim_to_tokens("a\nb\nc", 4, keep="end", counter=COUNTER), "b\nc")
+    self.assertEqual(trim_to_tokens("a\nb\nc", 4, keep="start", counter=COUNTER), "a\nb")
+    self.assertEqual(trim_to_tokens("abcdef", 3, keep="end", counter=COUNTER), "def")
+    self.assertEqual(trim_to_tokens("abc", 0, counter=COUNTER), "")
+    self.assertEqual(trim_to_tokens("a--bb--c", 5, keep="end", counter=COUNTER, sep="--"), "bb--c")
+
+  def test_llama2_tags(self):
+    self.assertIs(model_family("llama2"), LLAMA2)
+    self.assertEqual(model_family("zephyr").human_suffix, "")
+    self.assertEqual(LLAMA2.bos + LLAMA2.inst_start + LLAMA2.sys_start, "<s>[INST]<<SYS>>\n")
+    self.assertEqual(LLAMA2.sys_end, "\n<</SYS>>\n\n")
+
+  def test_family_of(self):
+    with mock.patch.dict(os.environ, {"PROMPT_MODEL_FAMILY": ""}):
+      self.assertIs(family_of(SimpleNamespace(repo_id="llama2-chat")), LLAMA2)
+      self.assertIs(family_of(SimpleNamespace(model_name="HuggingFaceH4/zephyr-7b-beta")), ZEPHYR)
+      self.assertIs(family_of(SimpleNamespace(repo_id=None, model="Llama2-13b")), LLAMA2)
+      self.assertIs(family_of(None), ZEPHYR)
+    with mock.patch.dict(os.environ, {"PROMPT_MODEL_FAMILY": "zephyr"}):
+      self.assertIs(family_of(SimpleNamespace(repo_id="llama2-chat")), ZEPHYR)
+
+  def test_tokenizer_counts_bounded(self):
+    class Encoding:
+      def __init__(self, ids):
+        self.ids = ids
+
+    class Tokenizer:
+      calls = 0
+
+      def encode(self, text, add_special_tokens=True):
+        Tokenizer.calls += 1
+        return Encoding(text.split())
+
+    counter = TokenCounter(cache_chars=128)
+    counter._tokenizer = Tokenizer()
+    self.assertEqual(counter.count("a b c"), 3)
+    self.assertEqual(counter.count("a b c"), 3)
+    self.assertEqual(Tokenizer.calls, 1)
+    for i in range(20):
+      counter.count(f"turn {i}")
+    self.assertLessEqual(counter._cached_chars, 128)
+    self.assertLessEqual(sum(len(text) for text in counter._counts), 128)
+    self.assertIn("turn 19", counter._counts)
+    # Too long to be kept
+    counter.count("x " * 50)
+    counter.count("x " * 50)
+    self.assertNotIn("x " * 50, counter._counts)
+
+
+@unittest.skipUnless(LANGCHAIN, "langchain not installed")
+class TestPromptComponents(unittest.TestCase):
+
+  def test_custom_prompt_without_budget(self):
+    from custom_components.custom_langchain_components.custom_prompt import CustomPromptTemplate
+
+    prompt = CustomPromptTemplate(input_variables=["history", "input"], template="{pre_prompt}|{context}|{history}|{input}",
+                                  pre_prompt="p", context="c")
+    self.assertEqual(prompt.max_tokens, 0)
+    self.assertEqual(prompt.format(history="h", input="i"), "p|c|h|i")
+
+  def test_dpn_agent_messages_per_family(self):
+    from custom_components.custom_langchain_components.dpn_bucket_tool import build_human_msg, build_sys_msg, human_msg, sys_msg
+
+    self.assertTrue(sys_msg.startswith("<s><<SYS>>\nAssistant is"))
+    self.assertTrue(sys_msg.endswith("\n<</SYS>>\n\n"))
+    self.assertTrue(human_msg.startswith("[INST] Use your existing tools"))
+    self.assertNotIn("<<SYS>>", build_sys_msg("", ZEPHYR))
+    self.assertTrue(build_sys_msg("t(a {x})", ZEPHYR).endswith("Tables available to SQL_tool:\nt(a {{x}})"))
+    self.assertTrue(build_human_msg(ZEPHYR).startswith(" Use your existing tools"))
+    self.assertNotIn("[/INST]", build_human_msg(ZEPHYR))
+
+  def test_llama2_history_tags_added_once(self):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    from custom_components.custom_langchain_components.custom_memory_buffer import CustomBufferMemory
+
+    memory = CustomBufferMemory(llm="llama2")
+    memory.chat_memory.add_message(HumanMessage(content="hi [/INST]\n"))
+    memory.chat_memory.add_message(AIMessage(content="hello"))
+    memory.parse_history()
+    memory.parse_history()
+    self.assertEqual([m.content for m in memory.chat_memory.messages], ["hi [/INST]\n", "hello </s><s>[INST]"])
+
+
+if __name__ == "__main__":
+  unittest.main()
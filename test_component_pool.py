@@ -0,0 +1,190 @@
+import asyncio
+import importlib.util
+import json
+import sys
+import types
+import unittest
+from unittest import mock
+
+from custom_components.runtime.component_pool import ComponentPool
+
+
+class Vertex:
+  """Stand-in for a langflow graph vertex."""
+
+  def __init__(self, id, vertex_type, output, params=None, base_type="custom_components"):
+    self.id = id
+    self.vertex_type = vertex_type
+    self.output = output
+    self.params = params or {}
+    self.base_type = base_type
+    self._built = False
+    self._built_object = None
+
+
+def llm(id, url="http://seldon:9000"):
+  return Vertex(id, "SeldonCore", ["BaseLLM", "SeldonCore"], {"code": "class Seldon...", "endpoint_url": url})
+
+
+class TestComponentPool(unittest.TestCase):
+
+  def test_keys(self):
+    pool = ComponentPool()
+    self.assertEqual(pool.key(llm("SeldonCore-a")), pool.key(llm("SeldonCore-b")))
+    self.assertNotEqual(pool.key(llm("SeldonCore-a")), pool.key(llm("SeldonCore-b", "http://other:9000")))
+    retriever = Vertex("Retriever-a", "CustomRetriever", ["BaseRetriever"], {"llm": llm("SeldonCore-a"), "k": 4})
+    same = Vertex("Retriever-b", "CustomRetriever", ["BaseRetriever"], {"llm": llm("SeldonCore-c"), "k": 4})
+    self.assertEqual(pool.key(retriever), pool.key(same))
+
+  def test_stateful_components_are_not_pooled(self):
+    pool = ComponentPool()
+    memory = Vertex("Memory-a", "ConversationBufferWindowMemory", ["BaseMemory", "BaseChatMemory"], base_type="memories")
+    agent = Vertex("Agent-a", "DpnSqlAgentIntializer", ["Chain", "AgentExecutor"], {"memory": memory})
+    tool = Vertex("Tool-a", "MemoryTool", ["BaseTool"], {"memory": memory})
+    self.assertIsNone(pool.key(memory))
+    self.assertIsNone(pool.key(agent))
+    self.assertIsNone(pool.key(tool))
+    self.assertIsNone(ComponentPool(exclude=["SeldonCore"]).key(llm("SeldonCore-a")))
+
+  def test_prime_reuses_pooled_instances(self):
+    pool = ComponentPool()
+    first = [llm("SeldonCore-a"), Vertex("SQLTool-a", "SQLTool", ["BaseTool", "SqlTool"], {"code": "sql"})]
+    keys = pool.prime(first)
+    self.assertEqual(len(keys), 2)
+    self.assertFalse(any(v._built for v in first))
+    instance = object()
+    self.assertTrue(pool.add(keys["SeldonCore-a"], "SeldonCore", instance))
+    self.assertEqual(pool.stats()["types"]["SeldonCore"]["refs"], 1)
+
+    second = [llm("SeldonCore-b")]
+    pool.prime(second)
+    self.assertTrue(second[0]._built)
+    self.assertIs(second[0]._built_object, instance)
+    stats = pool.stats()["types"]["SeldonCore"]
+    self.assertEqual((stats["entries"], stats["refs"], stats["hits"], stats["misses"]), (1, 2, 1, 1))
+    pool.release([keys["SeldonCore-a"]] * 2)
+    self.assertEqual(pool.stats()["types"]["SeldonCore"]["refs"], 0)
+
+  def test_eviction(self):
+    pool = ComponentPool(max_size=1, ttl=3600)
+    pool.add("a", "SQLTool", object())
+    # Referenced entries are kept even above max_size
+    pool.add("b", "SQLTool", object())
+    self.assertEqual(pool.stats()["size"], 2)
+    pool.release(["a"])
+    self.assertEqual(pool.stats()["size"], 1)
+    self.assertEqual(pool.stats()["types"]["SQLTool"]["evictions"], 1)
+
+    pool = ComponentPool(ttl=0)
+    pool.add("a", "SQLTool", object())
+    pool.release(["a"])
+    self.assertEqual(pool.stats()["size"], 0)
+
+
+class Graph:
+  """
+  Stand-in for a langflow graph: build() builds the vertices that are not
+  built yet, in order, and returns the object of the last one.
+  """
+
+  def __init__(self, vertices, built):
+    self.vertices = vertices
+    self.built = built
+
+  def get_vertex(self, vertex_id):
+    return next(v for v in self.vertices if v.id == vertex_id)
+
+  async def build(self):
+    for vertex in self.vertices:
+      if not vertex._built:
+        params = {k: v._built_object if isinstance(v, Vertex) else v for k, v in vertex.params.items()}
+        vertex._built_object = types.SimpleNamespace(vertex_type=vertex.vertex_type, **params)
+        vertex._built = True
+        self.built.append(vertex.vertex_type)
+    return self.vertices[-1]._built_object
+
+
+def flow_vertices():
+  llm_vertex = llm("SeldonCore-a")
+  memory = Vertex("Memory-a", "ConversationBufferWindowMemory", ["BaseMemory"], base_type="memories")
+  tool = Vertex("SQLTool-a", "SQLTool", ["BaseTool"], {"code": "sql", "llm": llm_vertex})
+  agent = Vertex("Agent-a", "DpnSqlAgentIntializer", ["Chain", "AgentExecutor"],
+                 {"llm": llm_vertex, "tool": tool, "memory": memory, "verbose": False},
+                 base_type="agents")
+  return [llm_vertex, memory, tool, agent]
+
+
+class TestLoadFlow(unittest.TestCase):
+
+  def setUp(self):
+    self.built = []
+    self.calls = []
+
+    def load_flow_from_json(flow, tweaks=None, build=True):
+      self.calls.append(("load_flow_from_json", build))
+      graph = Graph(flow_vertices(), self.built)
+      return asyncio.run(graph.build()) if build else graph
+
+    langflow = types.ModuleType("langflow")
+    langflow.load_flow_from_json = load_flow_from_json
+    process = types.ModuleType("langflow.processing.process")
+    process.fix_memory_inputs = lambda langchain_object: self.calls.append(("fix_memory_inputs", langchain_object))
+    patcher = mock.patch.dict(sys.modules, {
+      "langflow": langflow, "langflow.processing": types.ModuleType("langflow.processing"),
+      "langflow.processing.process": process,
+    })
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_second_build_reuses_pooled_components(self):
+    pool = ComponentPool()
+    with pool.load_flow({"data": {}}) as first:
+      self.assertEqual(self.built, ["SeldonCore", "ConversationBufferWindowMemory", "SQLTool", "DpnSqlAgentIntializer"])
+      self.assertEqual(pool.stats()["types"]["SeldonCore"]["refs"], 1)
+    self.assertEqual(pool.stats()["types"]["SeldonCore"]["refs"], 0)
+    self.assertEqual(self.calls, [("load_flow_from_json", False), ("fix_memory_inputs", first)])
+    self.assertIs(first.verbose, True)
+
+    self.built.clear()
+    with pool.load_flow({"data": {}}) as second:
+      # Only the memory and the agent are built again
+      self.assertEqual(self.built, ["ConversationBufferWindowMemory", "DpnSqlAgentIntializer"])
+      self.assertIsNot(second, first)
+      self.assertIs(second.llm, first.llm)
+      self.assertIs(second.tool, first.tool)
+      self.assertIsNot(second.memory, first.memory)
+      self.assertEqual(pool.stats()["types"]["SQLTool"]["refs"], 1)
+    stats = pool.stats()["types"]
+    self.assertEqual((stats["SeldonCore"]["hits"], stats["SQLTool"]["hits"]), (1, 1))
+    self.assertEqual(stats["SQLTool"]["refs"], 0)
+
+  def test_disabled(self):
+    pool = ComponentPool(max_size=0)
+    with pool.load_flow({"data": {}}):
+      pass
+    with pool.load_flow({"data": {}}):
+      pass
+    self.assertEqual(self.calls, [("load_flow_from_json", True)] * 2)
+    self.assertEqual(pool.stats()["size"], 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec("langflow"), "langflow not installed")
+class TestLoadFlowLangflow(unittest.TestCase):
+
+  def test_example_flow_built_twice(self):
+    with open("examples/multiple_tools_flow.json") as f:
+      flow = json.load(f)
+    pool = ComponentPool()
+    with pool.load_flow(flow) as first:
+      pass
+    pooled = pool.stats()["size"]
+    self.assertGreater(pooled, 0)
+    with pool.load_flow(flow) as second:
+      self.assertIsNot(second, first)
+    stats = pool.stats()
+    self.assertEqual(stats["size"], pooled)
+    self.assertEqual(sum(t["hits"] for t in stats["types"].values()), pooled)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,229 @@
+import importlib.util
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from custom_components.runtime.deadline import Deadline, DeadlineExceeded, check_deadline, deadline_scope
+
+LANGCHAIN = importlib.util.find_spec("langchain") is not None
+ADBC = LANGCHAIN and importlib.util.find_spec("adbc_driver_manager") is not None
+if LANGCHAIN:
+  from langchain.llms.fake import FakeListLLM
+  from langchain_core.prompts import ChatPromptTemplate
+  from langchain_core.tools import Tool
+
+  from custom_components.custom_langchain_components.concurrent_agent_executor import (
+    NO_ANSWER,
+    TIMED_OUT_OBSERVATION,
+    ConcurrentAgentExecutor,
+  )
+  from custom_components.custom_langchain_components.json_agent_output_parser import create_structured_chat_agent
+  from custom_components.custom_langchain_components.seldon_wrapper import SeldonCore
+
+
+def actions(*calls):
+  return "```json\n" + json.dumps([{"action": tool, "action_input": tool_input} for tool, tool_input in calls]) + "\n```"
+
+
+FINAL = '```json\n{"action": "Final Answer", "action_input": "done"}\n```'
+
+
+@unittest.skipUnless(LANGCHAIN, "langchain not installed")
+class TestConcurrentAgentExecutor(unittest.TestCase):
+
+  def setUp(self):
+    self.calls = []
+    self.lock = threading.Lock()
+
+  def tool(self, name, delay=0.0, check=True):
+    def run(tool_input):
+      with self.lock:
+        self.calls.append((name, tool_input))
+      time.sleep(delay)
+      if check:
+        check_deadline(f"running {name}")
+      return f"{name}:{tool_input}"
+    return Tool(name=name, func=run, description=f"{name} tool")
+
+  def run_agent(self, responses, tools, llm=None):
+    prompt = ChatPromptTemplate.from_messages([
+      ("system", "{tools}\n{tool_names}"),
+      ("human", "{input}\n{agent_scratchpad}"),
+    ])
+    agent = create_structured_chat_agent(llm or FakeListLLM(responses=responses), tools, prompt)
+    executor = ConcurrentAgentExecutor(agent=agent, tools=tools, return_intermediate_steps=True)
+    return executor.invoke({"input": "question"})
+
+  def test_actions_run_concurrently(self):
+    tools = [self.tool("List_dpn_bucket_content_tool", 0.5), self.tool("SQL_tool", 0.5)]
+    started = time.perf_counter()
+    result = self.run_agent([actions(("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")), FINAL], tools)
+    elapsed = time.perf_counter() - started
+    self.assertEqual(result["output"], "done")
+    self.assertEqual(sorted(self.calls), [("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")])
+    self.assertLess(elapsed, 0.9)
+
+  def test_observations_paired_with_actions(self):
+    tools = [self.tool("List_dpn_bucket_content_tool", 0.2), self.tool("SQL_tool")]
+    result = self.run_agent([actions(("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")), FINAL], tools)
+    steps = result["intermediate_steps"]
+    self.assertEqual([action.tool for action, _ in steps], ["List_dpn_bucket_content_tool", "SQL_tool"])
+    for action, observation in steps:
+      self.assertEqual(observation, f"{action.tool}:{action.tool_input}")
+
+  def test_repeated_actions_reuse_observations(self):
+    tools = [self.tool("List_dpn_bucket_content_tool"), self.tool("SQL_tool")]
+    result = self.run_agent([
+      actions(("SQL_tool", "select 1"), ("SQL_tool", "select 1")),
+      actions(("SQL_tool", "select 1"), ("List_dpn_bucket_content_tool", "demo")),
+      FINAL,
+    ], tools)
+    self.assertEqual(self.calls, [("SQL_tool", "select 1"), ("List_dpn_bucket_content_tool", "demo")])
+    self.assertEqual(len(result["intermediate_steps"]), 4)
+    for action, observation in result["intermediate_steps"]:
+      self.assertEqual(observation, f"{action.tool}:{action.tool_input}")
+
+  def test_deadline_answers_with_last_observation(self):
+    tools = [self.tool("List_dpn_bucket_content_tool"), self.tool("SQL_tool", 0.3)]
+    with deadline_scope(Deadline.after(0.15)) as deadline:
+      result = self.run_agent([
+        actions(("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")),
+        actions(("SQL_tool", "select 2")),
+        FINAL,
+      ], tools)
+    self.assertTrue(deadline.stopped_early)
+    self.assertEqual(result["output"], "List_dpn_bucket_content_tool:demo")
+    self.assertEqual(len(result["intermediate_steps"]), 2)
+
+  def test_deadline_without_observation(self):
+    with deadline_scope(Deadline.after(-1)) as deadline:
+      result = self.run_agent([FINAL], [self.tool("SQL_tool")])
+    self.assertTrue(deadline.stopped_early)
+    self.assertEqual(result["output"], NO_ANSWER)
+    self.assertEqual(self.calls, [])
+
+  def test_deadline_does_not_wait_for_tools(self):
+    tools = [self.tool("List_dpn_bucket_content_tool"), self.tool("SQL_tool", 1, check=False)]
+    started = time.perf_counter()
+    with deadline_scope(Deadline.after(0.2)) as deadline:
+      result = self.run_agent([actions(("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")), FINAL], tools)
+    self.assertLess(time.perf_counter() - started, 0.6)
+    self.assertTrue(deadline.stopped_early)
+    self.assertEqual(result["output"], "List_dpn_bucket_content_tool:demo")
+    self.assertEqual(result["intermediate_steps"][1][1], TIMED_OUT_OBSERVATION)
+
+    # A single call is abandoned as well
+    started = time.perf_counter()
+    with deadline_scope(Deadline.after(0.2)) as deadline:
+      result = self.run_agent([actions(("SQL_tool", "select 2")), FINAL], tools)
+    self.assertLess(time.perf_counter() - started, 0.6)
+    self.assertEqual(result["output"], NO_ANSWER)
+
+  def test_llm_read_timeout_at_deadline(self):
+    seldon = SeldonStub([(0, actions(("SQL_tool", "select 1"))), (1, FINAL)])
+    self.addCleanup(seldon.close)
+    with deadline_scope(Deadline.after(0.3)) as deadline:
+      result = self.run_agent([], [self.tool("SQL_tool")], llm=seldon.llm())
+    self.assertTrue(deadline.stopped_early)
+    self.assertEqual(result["output"], "SQL_tool:select 1")
+
+
+class SeldonStub:
+  """Seldon V2 inference endpoint answering `responses` (delay, text) in order."""
+
+  def __init__(self, responses):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    pending = list(responses)
+
+    class Handler(BaseHTTPRequestHandler):
+
+      def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        delay, text = pending.pop(0)
+        time.sleep(delay)
+        body = json.dumps({"outputs": [{"data": [json.dumps({"generated_text": text})]}]}).encode()
+        try:
+          self.send_response(200)
+          self.send_header("Content-Type", "application/json")
+          self.send_header("Content-Length", str(len(body)))
+          self.end_headers()
+          self.wfile.write(body)
+        except OSError:
+          # The client gave up
+          pass
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.server.daemon_threads = True
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def llm(self, **kwargs):
+    return SeldonCore(endpoint_url=f"http://127.0.0.1:{self.server.server_port}", task="text2text-generation", **kwargs)
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+@unittest.skipUnless(LANGCHAIN, "langchain not installed")
+class TestTransportTimeouts(unittest.TestCase):
+
+  def seldon(self, responses, **kwargs):
+    stub = SeldonStub(responses)
+    self.addCleanup(stub.close)
+    return stub.llm(**kwargs)
+
+  def test_read_timeout_at_deadline(self):
+    import requests
+
+    llm = self.seldon([(1, "late")])
+    with deadline_scope(Deadline.after(0.2)):
+      with self.assertRaises(DeadlineExceeded) as raised:
+        llm.invoke("question")
+    self.assertIsInstance(raised.exception.__cause__, requests.exceptions.ReadTimeout)
+
+  def test_read_timeout_with_time_left(self):
+    import requests
+
+    llm = self.seldon([(1, "late")], request_timeout=0.1)
+    with deadline_scope(Deadline.after(10)):
+      with self.assertRaises(requests.exceptions.ReadTimeout):
+        llm.invoke("question")
+
+  @unittest.skipUnless(ADBC, "adbc_driver_manager not installed")
+  def test_sql_rpc_timeout_at_deadline(self):
+    from adbc_driver_manager import AdbcStatusCode, OperationalError
+
+    from custom_components.custom_langchain_components import dpn_bucket_tool
+
+    class Database:
+      """Flight SQL answering the way the driver does when the rpc timeout set from the deadline fires."""
+
+      def __init__(self, delay):
+        self.delay = delay
+
+      def run(self, query):
+        time.sleep(self.delay)
+        raise OperationalError("TIMEOUT: [FlightSQL] context deadline exceeded (DeadlineExceeded; DoGet)",
+                               status_code=AdbcStatusCode.TIMEOUT)
+
+    with mock.patch.object(dpn_bucket_tool, "get_sql_database", lambda uri: Database(0.15)):
+      with deadline_scope(Deadline.after(0.1)):
+        with self.assertRaises(DeadlineExceeded) as raised:
+          dpn_bucket_tool.SqlTool().run("select count(*) from chargebacktenant where id = 1")
+      self.assertIsInstance(raised.exception.__cause__, OperationalError)
+
+    # Other driver errors are reported as they are
+    with mock.patch.object(dpn_bucket_tool, "get_sql_database", lambda uri: Database(0)):
+      with deadline_scope(Deadline.after(10)):
+        with self.assertRaises(OperationalError):
+          dpn_bucket_tool.SqlTool().run("select count(*) from chargebacktenant where id = 2")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,159 @@
+import importlib.util
+import json
+import os
+import time
+import unittest
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from custom_components.runtime.deadline import (
+  Deadline,
+  DeadlineExceeded,
+  check_deadline,
+  current_deadline,
+  deadline_for_request,
+  deadline_errors,
+  deadline_scope,
+  flow_timeout,
+  remaining_timeout,
+)
+
+FUNC = all(importlib.util.find_spec(m) is not None for m in ("parliament", "dotenv", "cloudevents"))
+
+
+class TestDeadline(unittest.TestCase):
+
+  def test_remaining(self):
+    deadline = Deadline.after(10)
+    self.assertGreater(deadline.remaining(), 9)
+    self.assertFalse(deadline.expired)
+    expired = Deadline.after(-1)
+    self.assertEqual(expired.remaining(), 0)
+    self.assertTrue(expired.expired)
+    with self.assertRaises(DeadlineExceeded):
+      expired.check()
+
+  def test_scope(self):
+    self.assertIsNone(current_deadline())
+    self.assertEqual(remaining_timeout(5), 5)
+    check_deadline()
+    with deadline_scope(Deadline.after(2)) as deadline:
+      self.assertIs(current_deadline(), deadline)
+      self.assertLessEqual(remaining_timeout(), 2)
+      self.assertEqual(remaining_timeout(1), 1)
+      with deadline_scope(Deadline.after(-1)):
+        with self.assertRaises(DeadlineExceeded):
+          remaining_timeout(1)
+        with self.assertRaises(DeadlineExceeded):
+          check_deadline()
+      self.assertIs(current_deadline(), deadline)
+    self.assertIsNone(current_deadline())
+
+  def test_deadline_errors(self):
+    with self.assertRaises(ConnectionError):
+      with deadline_errors("the call"):
+        raise ConnectionError("outside a request")
+    with deadline_scope(Deadline.after(10)):
+      with self.assertRaises(ConnectionError):
+        with deadline_errors("the call"):
+          raise ConnectionError("time left")
+    with deadline_scope(Deadline.after(-1)):
+      with self.assertRaises(DeadlineExceeded) as raised:
+        with deadline_errors("the call"):
+          raise ConnectionError("read timed out")
+    self.assertIn("read timed out", str(raised.exception))
+    self.assertIsInstance(raised.exception.__cause__, ConnectionError)
+
+  def test_flow_timeout(self):
+    with mock.patch.dict(os.environ, {"FLOW_TIMEOUT": "60", "FLOW_TIMEOUTS": '{"fast flow": 5}'}):
+      self.assertEqual(flow_timeout("fast flow"), 5)
+      self.assertEqual(flow_timeout("other flow"), 60)
+
+  def test_deadline_for_request(self):
+    with mock.patch.dict(os.environ, {"FLOW_TIMEOUT": "60", "FLOW_TIMEOUTS": "{}"}):
+      self.assertGreater(deadline_for_request({}, None, "flow").remaining(), 59)
+      self.assertLessEqual(deadline_for_request({"X-Request-Timeout": "3"}, None, "flow").remaining(), 3)
+      at = (datetime.now(timezone.utc) + timedelta(seconds=10)).isoformat().replace("+00:00", "Z")
+      deadline = deadline_for_request({"X-Request-Timeout": "30"}, {"deadline": at}, "flow")
+      self.assertLessEqual(deadline.remaining(), 10)
+      self.assertGreater(deadline.remaining(), 8)
+      # A later deadline than the flow timeout does not extend it
+      deadline = deadline_for_request({"X-Request-Timeout": "600"}, {"deadline": "not a date"}, "flow")
+      self.assertLessEqual(deadline.remaining(), 60)
+
+
+class FakePool:
+  """Component pool whose flows run `run`."""
+
+  def __init__(self, run):
+    self.run = run
+
+  def load_flow(self, flow, tweaks=None):
+    return nullcontext(self.run)
+
+
+@unittest.skipUnless(FUNC, "function dependencies not installed")
+class TestFuncDeadline(unittest.TestCase):
+
+  def setUp(self):
+    import func
+    from flask import Flask
+
+    self.func = func
+    self.app = Flask(__name__)
+    for name, value in {"install_compiled_code_cache": lambda: None,
+                        "get_flow_by_name": lambda name: {"data": {}}}.items():
+      patcher = mock.patch.object(func, name, value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def call(self, timeout, run):
+    from parliament import Context
+
+    headers = {
+      "Ce-Id": "1", "Ce-Source": "test", "Ce-Specversion": "1.0",
+      "Ce-Type": "io.hitachivantara.langflow.execute.v1", "Content-Type": "application/json",
+      "X-Request-Timeout": str(timeout),
+    }
+    body = json.dumps({"name": "flow", "inputs": {"input": "q"}})
+    with mock.patch.object(self.func, "get_component_pool", lambda: FakePool(run)):
+      with self.app.test_request_context("/", method="POST", headers=headers, data=body):
+        from flask import request
+
+        response = self.func.main(Context(request))
+        if isinstance(response, tuple):
+          return response[1], response[0]
+        return response.status_code, response.get_json()
+
+  def test_deadline_exceeded(self):
+    def run(inputs):
+      check_deadline("running the flow")
+    status, body = self.call(0, run)
+    self.assertEqual(status, 504)
+    self.assertIn("Deadline exceeded", body["error"])
+
+  def test_error_after_deadline(self):
+    def run(inputs):
+      time.sleep(0.1)
+      raise ConnectionError("read timed out")
+    status, body = self.call(0.05, run)
+    self.assertEqual(status, 504)
+    self.assertIn("read timed out", body["error"])
+
+  def test_partial_answer(self):
+    def run(inputs):
+      current_deadline().stopped_early = True
+      return {"output": "last observation"}
+    status, body = self.call(30, run)
+    self.assertEqual(status, 200)
+    self.assertEqual(body, {"output": "last observation", "timed_out": True})
+
+  def test_answer_in_time(self):
+    status, body = self.call(30, lambda inputs: {"output": "done"})
+    self.assertEqual(status, 200)
+    self.assertEqual(body, {"output": "done"})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,140 @@
+import importlib.util
+import unittest
+from unittest import mock
+
+from custom_components.custom_langchain_components import dpn_s3_listing
+from custom_components.custom_langchain_components.dpn_s3_listing import (
+  BucketListingCache,
+  list_bucket,
+  parse_bucket_input,
+)
+
+MOTO = all(importlib.util.find_spec(m) is not None for m in ("boto3", "moto"))
+
+
+def make_bucket(n):
+  return {f"{'logs' if i % 3 else 'reports'}/{i:05d}.json": 10 for i in range(n)}
+
+
+@unittest.skipUnless(MOTO, "boto3 and moto not installed")
+class TestDpnS3Listing(unittest.TestCase):
+  """Lists buckets of moto's in-process S3 with the real boto3 client."""
+
+  def setUp(self):
+    import boto3
+    from moto import mock_aws
+
+    aws = mock_aws()
+    aws.start()
+    self.addCleanup(aws.stop)
+    self.s3 = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    self.list_calls = 0
+
+    def count(**kwargs):
+      self.list_calls += 1
+    self.s3.meta.events.register("before-call.s3.ListObjectsV2", count)
+    # Small pages so listings span several of them
+    patcher = mock.patch.object(dpn_s3_listing, "PAGE_SIZE", 100)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def bucket(self, name, objects):
+    self.s3.create_bucket(Bucket=name)
+    for key, size in objects.items():
+      self.s3.put_object(Bucket=name, Key=key, Body=b"x" * size)
+
+  def test_lists_past_first_page(self):
+    self.bucket("demo", make_bucket(250))
+    listing = list_bucket("demo", client=self.s3)
+    self.assertEqual(len(listing.keys), 250)
+    self.assertFalse(listing.truncated)
+    self.assertEqual(self.list_calls, 3)
+
+  def test_limit_and_summary(self):
+    self.bucket("demo", make_bucket(250))
+    listing = list_bucket("demo", limit=200, client=self.s3)
+    self.assertEqual(len(listing.keys), 200)
+    self.assertTrue(listing.truncated)
+    # Two pages of 100, not a third one for the keys past the limit
+    self.assertEqual(self.list_calls, 2)
+
+    summary = listing.summarize(max_keys=50)
+    self.assertEqual(len(summary["results"]), 50)
+    self.assertEqual(summary["object_count"], 200)
+    self.assertEqual(summary["total_size_bytes"], 2000)
+    self.assertEqual(summary["top_prefixes"][0], {"prefix": "logs/", "objects": 166})
+    self.assertEqual(summary["top_prefixes"][1], {"prefix": "reports/", "objects": 34})
+
+  def test_limit_sizes_pages(self):
+    self.bucket("demo", make_bucket(250))
+    listing = list_bucket("demo", limit=30, client=self.s3)
+    self.assertEqual(len(listing.keys), 30)
+    self.assertTrue(listing.truncated)
+    self.assertEqual(self.list_calls, 1)
+
+    listing = list_bucket("demo", limit=250, client=self.s3)
+    self.assertEqual(len(listing.keys), 250)
+    self.assertFalse(listing.truncated)
+
+  def test_small_listing_is_returned_as_is(self):
+    self.bucket("demo", {"mk.pdf": 1, "cpp.pdf": 2})
+    self.assertEqual(list_bucket("demo", client=self.s3).summarize(max_keys=50), {"results": ["cpp.pdf", "mk.pdf"]})
+
+  def test_prefix_and_delimiter(self):
+    self.bucket("demo", {"a.txt": 1, "logs/1": 1, "logs/2": 1, "reports/x/1": 1})
+    listing = list_bucket("demo", delimiter="/", client=self.s3)
+    self.assertEqual(listing.keys, ["a.txt"])
+    self.assertEqual(listing.common_prefixes, ["logs/", "reports/"])
+    self.assertEqual(list_bucket("demo", prefix="reports/", client=self.s3).keys, ["reports/x/1"])
+
+  def test_listing_cache(self):
+    now = [0.0]
+    self.bucket("demo", {"a": 1})
+    cache = BucketListingCache(ttl=10, clock=lambda: now[0])
+    cache.get_or_list("demo", client=self.s3)
+    cache.get_or_list("demo", client=self.s3)
+    self.assertEqual(self.list_calls, 1)
+    now[0] = 11
+    cache.get_or_list("demo", client=self.s3)
+    self.assertEqual(self.list_calls, 2)
+
+  def test_listing_cache_bounded(self):
+    now = [0.0]
+    for name in ("bucket-a", "bucket-b", "bucket-c"):
+      self.bucket(name, {f"{i}": 1 for i in range(10)})
+    self.bucket("bucket-big", {f"{i}": 1 for i in range(30)})
+    cache = BucketListingCache(ttl=10, max_entries=2, max_keys=25, clock=lambda: now[0])
+    cache.get_or_list("bucket-a", client=self.s3)
+    cache.get_or_list("bucket-b", client=self.s3)
+    cache.get_or_list("bucket-a", client=self.s3)
+    # bucket-b is the least recently used
+    cache.get_or_list("bucket-c", client=self.s3)
+    self.assertEqual(sorted(k[0] for k in cache._entries), ["bucket-a", "bucket-c"])
+    self.assertEqual(cache._keys, 20)
+    # Larger than the whole cache, not kept
+    cache.get_or_list("bucket-big", client=self.s3)
+    self.assertEqual(len(cache), 2)
+
+    # Expired listings are dropped on the next write
+    now[0] = 11
+    cache.get_or_list("bucket-b", client=self.s3)
+    self.assertEqual([k[0] for k in cache._entries], ["bucket-b"])
+    self.assertEqual(cache._keys, 10)
+
+    # The key bound applies across listings
+    cache = BucketListingCache(ttl=10, max_entries=10, max_keys=25, clock=lambda: now[0])
+    for name in ("bucket-a", "bucket-b", "bucket-c"):
+      cache.get_or_list(name, client=self.s3)
+    self.assertEqual([k[0] for k in cache._entries], ["bucket-b", "bucket-c"])
+    self.assertEqual(cache._keys, 20)
+
+
+class TestParseBucketInput(unittest.TestCase):
+
+  def test_parse_bucket_input(self):
+    self.assertEqual(parse_bucket_input("'demo'"), ("demo", ""))
+    self.assertEqual(parse_bucket_input("s3://demo/reports/"), ("demo", "reports/"))
+
+
+if __name__ == "__main__":
+  unittest.main()
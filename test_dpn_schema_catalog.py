@@ -0,0 +1,180 @@
+import importlib.util
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from custom_components.custom_langchain_components.dpn_schema_catalog import SchemaCatalog, SchemaSnapshot, sql_type_name
+
+PYARROW = importlib.util.find_spec("pyarrow") is not None
+DIALECT = PYARROW and all(importlib.util.find_spec(m) is not None for m in ("sqlalchemy", "sqlalchemy_dpn"))
+SQL_DATABASE = all(importlib.util.find_spec(m) is not None for m in ("langchain_community", "sqlalchemy"))
+
+
+def column(name, type_name, nullable=1):
+  return {"column_name": name, "xdbc_type_name": type_name, "xdbc_nullable": nullable}
+
+
+# Rows of adbc_get_objects(depth="columns"), one per catalog
+CATALOGS = [
+  {"catalog_name": "dpn", "catalog_db_schemas": [
+    {"db_schema_name": "public", "db_schema_tables": [
+      {"table_name": "chargebacktenant", "table_columns": [column("id", "BIGINT", 0), column("name", "VARCHAR(32)", None)]},
+      {"table_name": "bucket", "table_columns": [column("bucket", "VARCHAR")]},
+    ]},
+    {"db_schema_name": "empty", "db_schema_tables": []},
+  ]},
+  {"catalog_name": "other", "catalog_db_schemas": [
+    {"db_schema_name": "sales", "db_schema_tables": [
+      {"table_name": "orders", "table_columns": [column("total", "DECIMAL(10, 2)"), column("shape", "GEOMETRY")]},
+    ]},
+  ]},
+]
+
+
+def objects_table(rows=CATALOGS):
+  import pyarrow as pa
+
+  columns = pa.list_(pa.struct([
+    ("column_name", pa.utf8()), ("xdbc_type_name", pa.utf8()), ("xdbc_nullable", pa.int16()),
+  ]))
+  tables = pa.list_(pa.struct([("table_name", pa.utf8()), ("table_columns", columns)]))
+  schemas = pa.list_(pa.struct([("db_schema_name", pa.utf8()), ("db_schema_tables", tables)]))
+  schema = pa.schema([("catalog_name", pa.utf8()), ("catalog_db_schemas", schemas)])
+  return pa.Table.from_pylist(rows, schema=schema)
+
+
+@unittest.skipUnless(PYARROW, "pyarrow not installed")
+class TestSchemaSnapshot(unittest.TestCase):
+
+  def assertCatalogs(self, snapshot):
+    self.assertEqual(snapshot.schema_names(), ["public", "empty", "sales"])
+    self.assertEqual(snapshot.table_names("public"), ["chargebacktenant", "bucket"])
+    self.assertEqual(snapshot.table_names("empty"), [])
+    self.assertEqual(snapshot.table_names(), ["chargebacktenant", "bucket", "orders"])
+    self.assertEqual(snapshot.columns("chargebacktenant"), [
+      {"name": "id", "type_name": "BIGINT", "nullable": False},
+      {"name": "name", "type_name": "VARCHAR(32)", "nullable": True},
+    ])
+    self.assertEqual([c["name"] for c in snapshot.columns("orders", "sales")], ["total", "shape"])
+    self.assertIsNone(snapshot.columns("orders", "public"))
+
+  def test_nested(self):
+    snapshot = SchemaSnapshot.from_arrow(objects_table())
+    self.assertCatalogs(snapshot)
+    self.assertIn("chargebacktenant(id BIGINT, name VARCHAR(32))", snapshot.table_info())
+
+  def test_chunked(self):
+    import pyarrow as pa
+
+    table = pa.concat_tables([objects_table(CATALOGS[:1]), objects_table(CATALOGS[1:])])
+    self.assertEqual(table.column("catalog_db_schemas").num_chunks, 2)
+    self.assertCatalogs(SchemaSnapshot.from_arrow(table))
+
+  def test_sliced(self):
+    snapshot = SchemaSnapshot.from_arrow(objects_table().slice(1))
+    self.assertEqual(snapshot.schema_names(), ["sales"])
+    self.assertEqual(snapshot.table_names(), ["orders"])
+    self.assertEqual([c["name"] for c in snapshot.columns("orders")], ["total", "shape"])
+
+    snapshot = SchemaSnapshot.from_arrow(objects_table(CATALOGS + CATALOGS[:1]).slice(1, 1))
+    self.assertEqual(snapshot.table_names(), ["orders"])
+
+  def test_type_names(self):
+    self.assertEqual(sql_type_name("VARCHAR(32)"), "TEXT")
+    self.assertEqual(sql_type_name("decimal(10, 2)"), "DECIMAL")
+    self.assertIsNone(sql_type_name("GEOMETRY"))
+    self.assertIsNone(sql_type_name(None))
+
+
+class AdbcConnection:
+  """ADBC connection answering get_objects with `table`, recording the calls."""
+
+  def __init__(self, table):
+    self.table = table
+    self.calls = []
+
+  def adbc_get_objects(self, depth="all", db_schema_filter=None, **kwargs):
+    import pyarrow as pa
+
+    self.calls.append(("get_objects", depth, db_schema_filter))
+    return pa.RecordBatchReader.from_batches(self.table.schema, self.table.to_batches())
+
+  def adbc_get_table_schema(self, table_name, db_schema_filter=None):
+    import pyarrow as pa
+
+    self.calls.append(("get_table_schema", table_name, db_schema_filter))
+    return pa.schema([pa.field("total", pa.float64()), pa.field("shape", pa.binary())])
+
+  def close(self):
+    pass
+
+
+@unittest.skipUnless(DIALECT, "sqlalchemy_dpn not installed")
+class TestSnapshotDialect(unittest.TestCase):
+
+  def setUp(self):
+    from sqlalchemy.engine import make_url
+
+    from custom_components.custom_langchain_components import dpn_dialect
+
+    url = make_url("dpn+flightsql://dpn:80?token=test")
+    self.catalog = SchemaCatalog(url, refresh_interval=0)
+    patcher = mock.patch.object(dpn_dialect, "get_schema_catalog", lambda url: self.catalog)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.dbapi_conn = AdbcConnection(objects_table())
+    self.connection = SimpleNamespace(engine=SimpleNamespace(url=url), connection=self.dbapi_conn)
+    self.dialect = dpn_dialect.SnapshotDPNDialect()
+
+  def test_reflection_from_snapshot(self):
+    import sqlalchemy.types as sqltypes
+
+    self.assertEqual(self.dialect.get_schema_names(self.connection), ["public", "empty", "sales"])
+    self.assertEqual(self.dialect.get_table_names(self.connection, schema="public"), ["chargebacktenant", "bucket"])
+    self.assertEqual(self.dialect.get_table_names(self.connection, schema="empty"), [])
+    columns = self.dialect.get_columns(self.connection, "chargebacktenant", schema="public")
+    self.assertEqual([(c["name"], c["type"], c["nullable"]) for c in columns],
+                     [("id", sqltypes.BIGINT, False), ("name", sqltypes.TEXT, True)])
+    # One snapshot fetch answers everything
+    self.assertEqual(self.dbapi_conn.calls, [("get_objects", "columns", None)])
+
+  def test_unknown_schema_queries_server(self):
+    self.catalog.ensure(self.dbapi_conn)
+    self.dbapi_conn.calls.clear()
+    tables = self.dialect.get_table_names(self.connection, schema="staging")
+    self.assertEqual(self.dbapi_conn.calls, [("get_objects", "tables", "staging")])
+    # The stand-in server ignores the filter
+    self.assertEqual(tables, ["chargebacktenant", "bucket", "orders"])
+
+  def test_unknown_column_type_queries_server(self):
+    self.catalog.ensure(self.dbapi_conn)
+    self.dbapi_conn.calls.clear()
+    columns = self.dialect.get_columns(self.connection, "orders", schema="sales")
+    self.assertEqual(self.dbapi_conn.calls, [("get_table_schema", "orders", "sales")])
+    self.assertEqual([c["name"] for c in columns], ["total", "shape"])
+
+  def test_without_snapshot(self):
+    failing = AdbcConnection(objects_table())
+    failing.adbc_get_objects = mock.Mock(side_effect=[RuntimeError("unavailable"), self.dbapi_conn.adbc_get_objects("tables")])
+    self.connection.connection = failing
+    self.assertEqual(self.dialect.get_table_names(self.connection), ["chargebacktenant", "bucket", "orders"])
+    self.assertIsNone(self.catalog.snapshot)
+
+
+@unittest.skipUnless(SQL_DATABASE, "langchain_community not installed")
+class TestSqlDatabase(unittest.TestCase):
+
+  def test_one_database_per_uri(self):
+    from custom_components.custom_langchain_components import dpn_bucket_tool
+
+    with mock.patch.object(dpn_bucket_tool, "_sql_databases", {}), \
+         mock.patch.object(dpn_bucket_tool, "register_dialect") as register_dialect:
+      db = dpn_bucket_tool.get_sql_database("sqlite://")
+      self.assertIs(dpn_bucket_tool.get_sql_database("sqlite://"), db)
+      self.assertIsNot(dpn_bucket_tool.get_sql_database("sqlite:///:memory:"), db)
+      self.assertEqual(register_dialect.call_count, 2)
+      self.assertEqual(db.run("select 1"), "[(1,)]")
+
+
+if __name__ == "__main__":
+  unittest.main()
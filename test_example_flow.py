@@ -0,0 +1,31 @@
+import json
+import unittest
+
+# Custom components of the example flow and the sources they are copies of
+COMPONENT_SOURCES = {
+  "DpnSqlAgentIntializer": "custom_components/components/agents/dpn_sql_agent_intializer.py",
+  "S3Bucket": "custom_components/components/tools/s3_bucket.py",
+  "SQLTool": "custom_components/components/tools/SQLTool.py",
+}
+
+
+class TestExampleFlow(unittest.TestCase):
+
+  def test_components_match_sources(self):
+    with open("examples/multiple_tools_flow.json") as f:
+      nodes = json.load(f)["data"]["nodes"]
+    found = set()
+    for node in nodes:
+      component_type = node["data"]["type"]
+      if component_type not in COMPONENT_SOURCES:
+        continue
+      found.add(component_type)
+      with open(COMPONENT_SOURCES[component_type]) as f:
+        source = f.read()
+      with self.subTest(component=component_type):
+        self.assertEqual(node["data"]["node"]["template"]["code"]["value"].replace("\r\n", "\n"), source)
+    self.assertEqual(found, set(COMPONENT_SOURCES))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,205 @@
+import importlib.util
+import json
+import sys
+import types
+import unittest
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from custom_components.runtime import flow_plan
+from custom_components.runtime.flow_plan import CodeCache, PlanNotSupported, code_hash, compile_flow, expand_plan
+
+FUNC = all(importlib.util.find_spec(m) for m in ("parliament", "dotenv", "sqlalchemy"))
+
+
+def load_example():
+  with open("examples/multiple_tools_flow.json") as f:
+    return json.load(f)["data"]
+
+
+class TestFlowPlan(unittest.TestCase):
+
+  def test_compile_example(self):
+    data = load_example()
+    plan, code = compile_flow(data)
+    self.assertLess(len(json.dumps(plan)), len(json.dumps(data)) / 4)
+    order = [node["id"] for node in plan["nodes"]]
+    # The agent is built from every other component
+    self.assertEqual(order[-1], "DpnSqlAgentIntializer-pLLFl")
+    self.assertEqual(len(order), len(data["nodes"]))
+    # Custom components reference their code by hash
+    seldon = plan["nodes"][order.index("SeldonCore-wBvtJ")]
+    self.assertIn(seldon["code"], code)
+    self.assertNotIn("code", seldon["params"])
+    self.assertEqual(seldon["params"]["repo_id"]["value"], "llama2-13b-chat-gpu")
+    self.assertNotIn("display_name", seldon["params"]["repo_id"])
+    # Hidden fields keep their value
+    memory = plan["nodes"][order.index("ConversationBufferWindowMemory-LbpEx")]
+    self.assertFalse(memory["params"]["ai_prefix"]["show"])
+    self.assertEqual(memory["params"]["ai_prefix"]["value"], "AI")
+
+  def test_expand_round_trip(self):
+    data = load_example()
+    plan, code = compile_flow(data)
+    expanded = expand_plan(json.loads(json.dumps(plan)), code.__getitem__)
+    original = {node["id"]: node for node in data["nodes"]}
+    for node in expanded["nodes"]:
+      source = original[node["id"]]["data"]
+      self.assertEqual(node["data"]["type"], source["type"])
+      self.assertEqual(node["data"]["node"]["base_classes"], source["node"]["base_classes"])
+      template = node["data"]["node"]["template"]
+      self.assertEqual(template["_type"], source["node"]["template"]["_type"])
+      for name, field in source["node"]["template"].items():
+        if isinstance(field, dict):
+          self.assertEqual(template[name].get("value"), field.get("value"), name)
+    self.assertEqual(
+      [(e["source"], e["target"], e["data"]["targetHandle"]["fieldName"]) for e in expanded["edges"]],
+      [(e["source"], e["target"], e["data"]["targetHandle"]["fieldName"]) for e in data["edges"]],
+    )
+
+  def test_unsupported(self):
+    data = load_example()
+    edge = dict(data["edges"][0], source=data["edges"][0]["target"], target=data["edges"][0]["source"])
+    with self.assertRaises(PlanNotSupported):
+      compile_flow(dict(data, edges=data["edges"] + [edge]))
+    data["nodes"][0]["data"]["node"]["flow"] = {"data": {}}
+    with self.assertRaises(PlanNotSupported):
+      compile_flow(data)
+
+  def test_code_cache_compiles_once(self):
+    cache = CodeCache()
+    compiled = []
+    compile = lambda source: compiled.append(source) or object()
+    first = cache.compiled("class A: pass", compile)
+    self.assertIs(cache.compiled("class A: pass", compile), first)
+    self.assertEqual(len(compiled), 1)
+    cache.update({code_hash("x"): "x"})
+    self.assertEqual(cache.missing([code_hash("x"), code_hash("y")]), [code_hash("y")])
+    with self.assertRaises(KeyError):
+      cache[code_hash("y")]
+
+  def test_code_cache_installed_where_used(self):
+    compiled = []
+
+    def eval_custom_component_code(code):
+      compiled.append(code)
+      return type("Component", (), {})
+
+    # The defining module, and modules that imported the name from it
+    modules = {name: types.ModuleType(name) for name in (
+      "langflow", "langflow.interface", "langflow.interface.custom", "langflow.interface.custom.eval",
+      "langflow.interface.initialize", "langflow.interface.initialize.loading", "langflow.processing.process",
+    )}
+    for name in ("langflow.interface.custom.eval", "langflow.interface.initialize.loading", "langflow.processing.process"):
+      modules[name].eval_custom_component_code = eval_custom_component_code
+    modules["langflow.interface.initialize"].loading = modules["langflow.interface.initialize.loading"]
+    other = types.ModuleType("other")
+    other.eval_custom_component_code = eval_custom_component_code
+
+    with mock.patch.dict(sys.modules, dict(modules, other=other)), \
+         mock.patch.object(flow_plan, "_installed", False), \
+         mock.patch.object(flow_plan, "_code_cache", CodeCache()):
+      flow_plan.install_compiled_code_cache()
+      for name in ("langflow.interface.custom.eval", "langflow.interface.initialize.loading", "langflow.processing.process"):
+        with self.subTest(module=name):
+          component = modules[name].eval_custom_component_code("class A: pass")
+          self.assertIs(modules[name].eval_custom_component_code("class A: pass"), component)
+      self.assertEqual(compiled, ["class A: pass"])
+      # Only langflow is patched
+      self.assertIs(other.eval_custom_component_code, eval_custom_component_code)
+
+  @unittest.skipUnless(importlib.util.find_spec("langflow"), "langflow not installed")
+  def test_code_cache_installed_in_langflow(self):
+    from langflow.interface.initialize import loading
+
+    with mock.patch.object(flow_plan, "_installed", False):
+      eval_code = loading.eval_custom_component_code
+      try:
+        flow_plan.install_compiled_code_cache()
+        self.assertIsNot(loading.eval_custom_component_code, eval_code)
+        self.assertFalse([name for name, module in sys.modules.items() if name.startswith("langflow")
+                          and getattr(module, "eval_custom_component_code", None) is eval_code])
+      finally:
+        for module in list(sys.modules.values()):
+          if getattr(module, "eval_custom_component_code", None) is not None and module.__name__.startswith("langflow"):
+            module.eval_custom_component_code = eval_code
+
+  @unittest.skipUnless(FUNC, "sqlalchemy not installed")
+  def test_fetch_creates_no_tables(self):
+    from sqlalchemy import JSON, Column, MetaData, String, Table
+    from sqlalchemy.dialects.postgresql import UUID
+
+    flow_table = Table("flow", MetaData(), Column("id", UUID(as_uuid=True), primary_key=True),
+                       Column("user_id", UUID(as_uuid=True)), Column("name", String), Column("data", JSON))
+    store = flow_plan.FlowPlanStore(mock.Mock(), flow_table)
+    session = mock.Mock()
+    session.execute.return_value.first.return_value = None
+    with mock.patch.object(store.metadata, "create_all") as create_all:
+      self.assertIsNone(store.fetch(session, "flow"))
+      create_all.assert_not_called()
+      store.create_tables()
+      create_all.assert_called_once_with(store.engine, checkfirst=True)
+
+
+@unittest.skipUnless(FUNC, "function dependencies not installed")
+class TestFetchFlowPlan(unittest.TestCase):
+
+  def fetch(self, fetch):
+    import func
+
+    db = SimpleNamespace(session=mock.Mock(), plans=SimpleNamespace(fetch=fetch))
+    return func.fetch_flow_plan(db, "flow"), db
+
+  def test_plan(self):
+    plan, code = compile_flow(load_example())
+    record = {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "name": "flow", "plan": plan}
+    with mock.patch("func.get_code_cache", lambda: code):
+      result, _ = self.fetch(lambda session, name: record)
+    self.assertEqual(result["name"], "flow")
+    self.assertEqual(len(result["data"]["nodes"]), len(plan["nodes"]))
+    self.assertIsNone(self.fetch(lambda session, name: None)[0])
+
+  def test_falls_back_on_errors(self):
+    plan, _ = compile_flow(load_example())
+    record = {"id": uuid.uuid4(), "user_id": uuid.uuid4(), "name": "flow", "plan": plan}
+    # Component code missing from the side table
+    with mock.patch("func.get_code_cache", lambda: CodeCache()):
+      result, db = self.fetch(lambda session, name: record)
+    self.assertIs(result, False)
+    db.session.rollback.assert_called_once()
+    self.assertIsNotNone(db.plans)
+
+    def stale(session, name):
+      raise KeyError("nodes")
+    self.assertIs(self.fetch(stale)[0], False)
+
+    def unsupported(session, name):
+      raise PlanNotSupported("grouped")
+    self.assertIs(self.fetch(unsupported)[0], False)
+
+  def test_unusable_tables_disable_plans(self):
+    from sqlalchemy.exc import ProgrammingError
+
+    def denied(session, name):
+      raise ProgrammingError("CREATE TABLE flow_plan", {}, Exception("permission denied"))
+    result, db = self.fetch(denied)
+    self.assertIs(result, False)
+    self.assertIsNone(db.plans)
+
+  def test_database_errors_raised(self):
+    from sqlalchemy.exc import OperationalError
+
+    def unreachable(session, name):
+      raise OperationalError("SELECT flow", {}, Exception("connection refused"))
+    db = SimpleNamespace(session=mock.Mock(), plans=SimpleNamespace(fetch=unreachable))
+    import func
+
+    # Retried by fetch_flow_by_name, not answered with a second query for the stored flow
+    with self.assertRaises(OperationalError):
+      func.fetch_flow_plan(db, "flow")
+    self.assertIsNotNone(db.plans)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,55 @@
+import importlib.util
+import os
+import unittest
+
+from importtime_report import format_table, imported, measure, total_ms
+
+# Cold import budgets in milliseconds, generous enough for a loaded CI runner
+RUNTIME_BUDGET_MS = float(os.getenv("RUNTIME_IMPORT_BUDGET_MS", 500))
+FUNC_BUDGET_MS = float(os.getenv("FUNC_IMPORT_BUDGET_MS", 1500))
+
+HEAVY = {"langflow", "langchain", "langchain_community", "sqlalchemy", "boto3", "pyarrow", "adbc_driver_flightsql"}
+
+
+def installed(*modules):
+  return all(importlib.util.find_spec(m) is not None for m in modules)
+
+
+class TestImportBudget(unittest.TestCase):
+
+  def assertCheapImport(self, module, budget_ms, allowed=()):
+    entries = measure(module)
+    heavy = {m.split(".")[0] for m in imported(entries)} & (HEAVY - set(allowed))
+    self.assertFalse(heavy, f"importing {module} loads {sorted(heavy)}\n{format_table(entries)}")
+    self.assertLess(total_ms(entries), budget_ms, format_table(entries))
+
+  def test_runtime_helpers(self):
+    for module in (
+      "custom_components.runtime.deadline",
+      "custom_components.runtime.admission",
+      "custom_components.runtime.component_pool",
+      "custom_components.runtime.flow_plan",
+      "custom_components.runtime.preload",
+      "custom_components.custom_langchain_components.sql_result_cache",
+      "custom_components.custom_langchain_components.dpn_schema_catalog",
+      "custom_components.custom_langchain_components.dpn_s3_listing",
+      "custom_components.custom_langchain_components.prompt_registry",
+      "custom_components.custom_langchain_components.compiled_prompt",
+    ):
+      with self.subTest(module=module):
+        self.assertCheapImport(module, RUNTIME_BUDGET_MS)
+
+  @unittest.skipUnless(installed("parliament", "dotenv"), "function dependencies not installed")
+  def test_func(self):
+    self.assertCheapImport("func", FUNC_BUDGET_MS)
+
+  @unittest.skipUnless(installed("langchain"), "langchain not installed")
+  def test_dpn_tools(self):
+    self.assertCheapImport(
+      "custom_components.custom_langchain_components.dpn_bucket_tool", FUNC_BUDGET_MS,
+      allowed=("langchain",),
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,123 @@
+import importlib.util
+import unittest
+
+from custom_components.custom_langchain_components.json_repair import repair_json_actions
+
+LANGCHAIN = importlib.util.find_spec("langchain") is not None
+if LANGCHAIN:
+  from langchain_core.agents import AgentAction, AgentFinish
+  from langchain_core.exceptions import OutputParserException
+
+  from custom_components.custom_langchain_components.json_agent_output_parser import (
+    RepairingJSONAgentOutputParser,
+  )
+
+
+class TestJsonRepair(unittest.TestCase):
+
+  def test_valid_output(self):
+    text = '```json\n{"action": "SQL_tool", "action_input": "select 1"}\n```'
+    self.assertEqual(repair_json_actions(text), [{"action": "SQL_tool", "action_input": "select 1"}])
+
+  def test_escaped_and_unbalanced_fences(self):
+    text = 'Assistant: ```json\n{"action": "Final Answer",\n "action_input": "done"}\n\\```'
+    self.assertEqual(repair_json_actions(text), [{"action": "Final Answer", "action_input": "done"}])
+    text = '```json\n{"action": "SQL_tool", "action_input": "select 1"}'
+    self.assertEqual(repair_json_actions(text)[0]["action"], "SQL_tool")
+
+  def test_trailing_text(self):
+    text = '{"action": "SQL_tool", "action_input": "select 1"}\nUser: Observation - results []'
+    self.assertEqual(repair_json_actions(text), [{"action": "SQL_tool", "action_input": "select 1"}])
+
+  def test_single_quotes(self):
+    text = "```json\n{'action': 'List_dpn_bucket_content_tool', 'action_input': 'it\\'s \"demo\"'}\n```"
+    self.assertEqual(
+      repair_json_actions(text),
+      [{"action": "List_dpn_bucket_content_tool", "action_input": "it's \"demo\""}],
+    )
+
+  def test_missing_braces(self):
+    text = '```json\n{"action": "Final Answer", "action_input": {"rows": [1, 2'
+    self.assertEqual(repair_json_actions(text), [{"action": "Final Answer", "action_input": {"rows": [1, 2]}}])
+    text = '{"action": "Final Answer", "action_input": "the bucket contents are'
+    self.assertEqual(repair_json_actions(text)[0]["action_input"], "the bucket contents are")
+
+  def test_escaped_template_braces(self):
+    text = '```json\n{{"action": "SQL_tool", "action_input": "select 1"}}\n```'
+    self.assertEqual(repair_json_actions(text), [{"action": "SQL_tool", "action_input": "select 1"}])
+
+  def test_several_action_blocks(self):
+    text = (
+      '```json\n{"action": "SQL_tool", "action_input": "select 1"}\n```\n'
+      '```json\n{"action": "List_dpn_bucket_content_tool", "action_input": "demo",}\n```'
+    )
+    self.assertEqual(
+      [a["action"] for a in repair_json_actions(text)],
+      ["SQL_tool", "List_dpn_bucket_content_tool"],
+    )
+
+  def test_action_list(self):
+    text = '```json\n[{"action": "List_dpn_bucket_content_tool", "action_input": "demo"}, {"action": "SQL_tool", "action_input": "select 1"}]\n```'
+    self.assertEqual(
+      [a["action"] for a in repair_json_actions(text)],
+      ["List_dpn_bucket_content_tool", "SQL_tool"],
+    )
+
+  def test_no_json(self):
+    self.assertEqual(repair_json_actions("I cannot help with that."), [])
+
+
+@unittest.skipUnless(LANGCHAIN, "langchain not installed")
+class TestRepairingJSONAgentOutputParser(unittest.TestCase):
+
+  def setUp(self):
+    self.parser = RepairingJSONAgentOutputParser()
+
+  def assertActions(self, output, expected):
+    self.assertIsInstance(output, list)
+    self.assertEqual([(a.tool, a.tool_input) for a in output], expected)
+
+  def test_single_action(self):
+    output = self.parser.parse('```json\n{"action": "SQL_tool", "action_input": "select 1"}\n```')
+    self.assertIsInstance(output, AgentAction)
+    self.assertEqual((output.tool, output.tool_input), ("SQL_tool", "select 1"))
+
+  def test_unescaped_quotes(self):
+    output = self.parser.parse('```json\n{"action": "SQL_tool", "action_input": "select "a" from t"}\n```')
+    self.assertEqual(output.tool_input, 'select "a" from t')
+
+  def test_final_answer(self):
+    output = self.parser.parse('```json\n{"action": "Final Answer", "action_input": "done"}\n```')
+    self.assertIsInstance(output, AgentFinish)
+    self.assertEqual(output.return_values, {"output": "done"})
+
+  def test_action_list(self):
+    expected = [("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")]
+    text = (
+      '[{"action":"List_dpn_bucket_content_tool","action_input":"demo"},'
+      '{"action":"SQL_tool","action_input":"select 1"}]'
+    )
+    self.assertActions(self.parser.parse(text), expected)
+    self.assertActions(self.parser.parse(f"```json\n{text}\n```"), expected)
+
+  def test_several_objects_in_one_block(self):
+    text = (
+      '```json\n{"action": "List_dpn_bucket_content_tool", "action_input": "demo"}\n'
+      '{"action": "SQL_tool", "action_input": "select 1"}\n```'
+    )
+    self.assertActions(self.parser.parse(text), [("List_dpn_bucket_content_tool", "demo"), ("SQL_tool", "select 1")])
+
+  def test_several_blocks_with_repair(self):
+    text = (
+      '```json\n{"action": "SQL_tool", "action_input": "select 1"}\n```\n'
+      "```json\n{'action': 'List_dpn_bucket_content_tool', 'action_input': 'demo',}\n```"
+    )
+    self.assertActions(self.parser.parse(text), [("SQL_tool", "select 1"), ("List_dpn_bucket_content_tool", "demo")])
+
+  def test_unparseable(self):
+    with self.assertRaises(OutputParserException):
+      self.parser.parse("I cannot help with that.")
+
+
+if __name__ == "__main__":
+  unittest.main()
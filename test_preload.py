@@ -0,0 +1,139 @@
+import gc
+import importlib.util
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from custom_components.runtime import preload
+
+
+class TestWorkerLayout(unittest.TestCase):
+
+  def layout(self, cpus, *args, **kwargs):
+    with mock.patch.object(preload, "cpu_limit", return_value=cpus):
+      return preload.worker_layout(*args, **kwargs)
+
+  def test_unlimited_concurrency(self):
+    self.assertEqual(self.layout(4, 0), (4, 4))
+
+  def test_covers_container_concurrency(self):
+    self.assertEqual(self.layout(4, 10), (4, 3))
+    self.assertEqual(self.layout(8, 2), (2, 1))
+
+  def test_overrides(self):
+    self.assertEqual(self.layout(4, 10, workers=2), (2, 5))
+    self.assertEqual(self.layout(4, 10, workers=1, threads=2), (1, 2))
+
+  def test_split_env_list(self):
+    with mock.patch.dict("os.environ", {"PRELOAD_FLOWS": " a, b ,,"}):
+      self.assertEqual(preload.split_env_list("PRELOAD_FLOWS"), ["a", "b"])
+    with mock.patch.dict("os.environ", {}, clear=True):
+      self.assertEqual(preload.split_env_list("PRELOAD_FLOWS", ("x",)), ["x"])
+
+
+class TestPreload(unittest.TestCase):
+
+  def test_preload_modules(self):
+    name = "custom_components.runtime.admission"
+    with mock.patch.dict(sys.modules):
+      sys.modules.pop(name, None)
+      self.assertEqual(preload.preload_modules([name, "no_such_module", "json"]), [name, "json"])
+      self.assertIn(name, sys.modules)
+
+  def test_freeze_gc(self):
+    self.addCleanup(gc.unfreeze)
+    preload.freeze_gc()
+    self.assertGreater(gc.get_freeze_count(), 0)
+
+  def test_warm_flows(self):
+    func = types.SimpleNamespace(pin_flow=mock.Mock(side_effect=[
+      {"name": "flow"}, ({"error": "Record not found"}, 404),
+    ]))
+    self.assertEqual(preload.warm_flows(func, ["flow", "missing"]), ["flow"])
+    self.assertEqual(func.pin_flow.call_args_list, [mock.call("flow"), mock.call("missing")])
+
+
+@unittest.skipUnless(all(importlib.util.find_spec(m) for m in ("parliament", "dotenv")),
+                     "function dependencies not installed")
+class TestWarmFlows(unittest.TestCase):
+
+  def setUp(self):
+    import func
+
+    self.func = func
+    self.fetched = []
+    self.version = 1
+
+    def fetch(name, *args):
+      self.fetched.append(name)
+      if name == "missing":
+        return {"error": "Record not found"}, 404
+      return {"name": name, "data": {"version": self.version}}
+    patches = [
+      mock.patch.object(func, "fetch_flow_by_name", fetch),
+      mock.patch.object(func, "FLOW_CACHE_TTL", 30),
+      mock.patch.object(func, "_flow_cache", {}),
+      mock.patch.object(func, "_pinned_flows", set()),
+      mock.patch.object(func, "_flow_refresher", None),
+    ]
+    for patcher in patches:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def expire(self, name):
+    fetched_at, record = self.func._flow_cache[name]
+    self.func._flow_cache[name] = (fetched_at - 3600, record)
+
+  def start_refresher(self, interval):
+    stop = threading.Event()
+    thread = self.func.start_flow_refresher(interval, stop)
+    if thread is not None:
+      self.addCleanup(thread.join)
+      self.addCleanup(stop.set)
+    return thread, stop
+
+  def test_warmed_flows_do_not_expire(self):
+    self.assertEqual(preload.warm_flows(self.func, ["flow", "missing"]), ["flow"])
+    self.start_refresher(3600)
+    # Long after the TTL, e.g. in a worker forked later
+    self.expire("flow")
+    self.assertEqual(self.func.get_flow_by_name("flow")["data"], {"version": 1})
+    self.assertEqual(self.fetched, ["flow", "missing"])
+
+  def test_pinned_flows_expire_without_refresher(self):
+    preload.warm_flows(self.func, ["flow"])
+    self.version = 2
+    self.expire("flow")
+    self.assertEqual(self.func.get_flow_by_name("flow")["data"], {"version": 2})
+
+    # Nor once the refresher stopped
+    _, stop = self.start_refresher(3600)
+    stop.set()
+    self.func._flow_refresher.join()
+    self.version = 3
+    self.expire("flow")
+    self.assertEqual(self.func.get_flow_by_name("flow")["data"], {"version": 3})
+
+  def test_refresh(self):
+    preload.warm_flows(self.func, ["flow"])
+    self.version = 2
+    self.func.refresh_pinned_flows()
+    self.assertEqual(self.func.get_flow_by_name("flow")["data"], {"version": 2})
+
+  def test_refresher_thread(self):
+    self.assertEqual(self.start_refresher(0.01), (None, mock.ANY))
+    preload.warm_flows(self.func, ["flow"])
+    self.version = 2
+    self.start_refresher(0.01)
+    for _ in range(100):
+      if self.func.get_flow_by_name("flow")["data"] == {"version": 2}:
+        break
+      time.sleep(0.01)
+    self.assertEqual(self.func.get_flow_by_name("flow")["data"], {"version": 2})
+
+
+if __name__ == "__main__":
+  unittest.main()
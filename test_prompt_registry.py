@@ -0,0 +1,103 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from custom_components.custom_langchain_components import prompt_registry
+from custom_components.custom_langchain_components.prompt_registry import PromptCache
+
+LANGCHAIN = importlib.util.find_spec("langchain") is not None
+
+
+class TestPromptCache(unittest.TestCase):
+
+  def test_content_addressed(self):
+    with tempfile.TemporaryDirectory() as root:
+      cache = PromptCache(Path(root))
+      self.assertIsNone(cache.get("owner/prompt"))
+      digest = cache.put("owner/prompt", '{"a": 1}')
+      self.assertEqual(cache.put("owner/other", '{"a": 1}'), digest)
+      self.assertEqual(cache.get("owner/prompt"), '{"a": 1}')
+      self.assertEqual(len(os.listdir(Path(root) / "objects")), 1)
+
+      cache.put("owner/prompt", '{"a": 2}')
+      self.assertEqual(cache.get("owner/prompt"), '{"a": 2}')
+      self.assertEqual(cache.get("owner/other"), '{"a": 1}')
+
+  def test_corrupt_object_ignored(self):
+    with tempfile.TemporaryDirectory() as root:
+      cache = PromptCache(Path(root))
+      digest = cache.put("owner/prompt", '{"a": 1}')
+      (Path(root) / "objects" / f"{digest}.json").write_text('{"a": 3}')
+      self.assertIsNone(cache.get("owner/prompt"))
+
+
+@unittest.skipUnless(LANGCHAIN, "langchain not installed")
+class TestPromptRegistry(unittest.TestCase):
+
+  def setUp(self):
+    prompt_registry._pull_prompt.cache_clear()
+    prompt_registry._build_chat_prompt.cache_clear()
+    self.cache_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.cache_dir.cleanup)
+    env = {"PROMPT_CACHE_DIR": self.cache_dir.name, "PROMPT_REGISTRY_OFFLINE": "true"}
+    patcher = mock.patch.dict(os.environ, env)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def test_local_spec(self):
+    prompt = prompt_registry.pull_prompt("coty/react-chat-json-v1")
+    self.assertTrue({"tools", "tool_names", "agent_scratchpad", "input"} <= set(prompt.input_variables))
+
+  def test_cached_prompt(self):
+    from langchain.load.dump import dumps
+    from langchain_core.prompts import ChatPromptTemplate
+
+    prompt = ChatPromptTemplate.from_messages([("human", "Hello {name}")])
+    PromptCache(Path(self.cache_dir.name)).put("owner/cached", dumps(prompt))
+    self.assertEqual(prompt_registry.pull_prompt("owner/cached").format_messages(name="a")[0].content, "Hello a")
+
+  def test_offline_miss(self):
+    with self.assertRaises(LookupError):
+      prompt_registry.pull_prompt("owner/missing")
+
+  def test_callers_get_copies(self):
+    prompt = prompt_registry.pull_prompt("coty/react-chat-json-v1")
+    messages, input_variables = list(prompt.messages), list(prompt.input_variables)
+    prompt.messages.pop()
+    prompt.input_variables.append("extra")
+    prompt.partial_variables["tools"] = "t"
+    again = prompt_registry.pull_prompt("coty/react-chat-json-v1")
+    self.assertIsNot(again, prompt)
+    self.assertEqual((again.messages, again.input_variables, again.partial_variables), (messages, input_variables, {}))
+    # Only the containers are copied, the message templates are shared
+    self.assertIs(again.messages[0], messages[0])
+
+    chat = prompt_registry.get_chat_prompt("coty/react-chat-json-v1", ("System {tools} {tool_names}", None))
+    chat.messages[0] = messages[0]
+    chat = prompt_registry.get_chat_prompt("coty/react-chat-json-v1", ("System {tools} {tool_names}", None))
+    self.assertEqual(chat.messages[0].prompt.template, "System {tools} {tool_names}")
+    self.assertEqual(chat.messages[0].prompt.format(tools="t", tool_names="n"), "System t n")
+    self.assertEqual(chat.partial(tools="t", tool_names="n").format_messages(input="q", agent_scratchpad="")[0].content,
+                     "System t n")
+
+  def test_budget_covers_whole_prompt(self):
+    system = "S" * 350
+    chat = prompt_registry.get_chat_prompt("coty/react-chat-json-v1", (system, "{input}\n{agent_scratchpad}"))
+    system_prompt, human_prompt = (message.prompt for message in chat.messages)
+    # At the default 3.5 characters per token: the newline of the human message, the system message
+    self.assertEqual(system_prompt.reserved_tokens, 1)
+    self.assertEqual(human_prompt.reserved_tokens, 100)
+
+    steps = "".join(f"action {i}\nObservation: {'r' * 60}\nThought: " for i in range(3))
+    with mock.patch.dict(os.environ, {"PROMPT_TOKEN_BUDGET": "160"}):
+      rendered = human_prompt.format(input="q", agent_scratchpad=steps)
+    # The system message leaves 60 tokens, the oldest steps are dropped first
+    self.assertNotIn("action 0", rendered)
+    self.assertIn("action 2", rendered)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,181 @@
+import importlib.util
+import threading
+import time
+import unittest
+
+from custom_components.custom_langchain_components.sql_result_cache import (
+  QueryResultCache,
+  is_read_only,
+  normalize_sql,
+  referenced_tables,
+)
+from custom_components.runtime.deadline import Deadline, DeadlineExceeded, deadline_scope
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class TestSqlResultCache(unittest.TestCase):
+
+  def test_normalize_sql(self):
+    self.assertEqual(
+      normalize_sql("  SELECT *\n  FROM chargebacktenant   LIMIT 10; "),
+      "select * from chargebacktenant limit 10",
+    )
+    self.assertEqual(normalize_sql("'select 1'"), "select 1")
+    self.assertEqual(normalize_sql("select * from t where name = 'A  B'"), "select * from t where name='A  B'")
+
+  def test_read_only(self):
+    self.assertTrue(is_read_only(normalize_sql("select * from t")))
+    self.assertTrue(is_read_only(normalize_sql("select * from t where note = 'drop table t'")))
+    self.assertFalse(is_read_only(normalize_sql("delete from t")))
+    self.assertFalse(is_read_only(normalize_sql("select 1; drop table t")))
+    self.assertFalse(is_read_only(normalize_sql("SELECT * INTO copy FROM t")))
+    self.assertTrue(is_read_only(normalize_sql("select * from t where note = 'into'")))
+
+  def test_referenced_tables(self):
+    self.assertEqual(referenced_tables("select * from dpn.Tenants t join usage u on t.id=u.id"), ["tenants", "usage"])
+
+  def test_hit_and_ttl(self):
+    clock = FakeClock()
+    cache = QueryResultCache(default_ttl=10, table_ttls={"usage": 1}, clock=clock)
+    calls = []
+
+    def execute():
+      calls.append(1)
+      return "rows"
+
+    cache.get_or_execute("select * from t", "uri", execute)
+    cache.get_or_execute("SELECT *  FROM t", "uri", execute)
+    cache.get_or_execute("select * from t", "other-uri", execute)
+    self.assertEqual(len(calls), 2)
+
+    cache.get_or_execute("select * from usage", "uri", execute)
+    clock.now = 2
+    cache.get_or_execute("select * from usage", "uri", execute)
+    cache.get_or_execute("select * from t", "uri", execute)
+    self.assertEqual(len(calls), 4)
+    self.assertEqual(cache.stats()["expired"], 1)
+
+  def test_writes_bypass_cache(self):
+    cache = QueryResultCache()
+    calls = []
+    for _ in range(2):
+      cache.get_or_execute("insert into t values (1)", "uri", lambda: calls.append(1))
+    self.assertEqual(len(calls), 2)
+    self.assertEqual(cache.stats()["bypassed"], 2)
+
+  def test_byte_bound_evicts_lru(self):
+    cache = QueryResultCache(max_bytes=10)
+    cache.get_or_execute("select a from t", "uri", lambda: "aaaaa")
+    cache.get_or_execute("select b from t", "uri", lambda: "bbbbb")
+    cache.get_or_execute("select a from t", "uri", lambda: "aaaaa")
+    cache.get_or_execute("select c from t", "uri", lambda: "ccccc")
+    stats = cache.stats()
+    self.assertEqual(stats["evictions"], 1)
+    self.assertLessEqual(stats["bytes"], 10)
+    self.assertEqual(cache.get_or_execute("select a from t", "uri", lambda: "miss"), "aaaaa")
+
+  def test_single_flight(self):
+    cache = QueryResultCache()
+    calls = []
+    started = threading.Event()
+
+    def execute():
+      calls.append(1)
+      started.set()
+      time.sleep(0.1)
+      return "rows"
+
+    results = []
+    threads = [
+      threading.Thread(target=lambda: results.append(cache.get_or_execute("select * from t", "uri", execute)))
+      for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+      t.start()
+    for t in threads:
+      t.join()
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(results, ["rows"] * 5)
+    self.assertEqual(cache.stats()["coalesced"], 4)
+
+  def coalesce(self, cache, first_error, follower_deadline=None):
+    """
+    Run the same query in a leader failing with `first_error` and a follower
+    waiting for it. Returns the follower's result or error and the calls.
+    """
+    calls = []
+    waiting = threading.Event()
+
+    def execute():
+      calls.append(1)
+      if len(calls) == 1:
+        waiting.wait(5)
+        time.sleep(0.05)
+        raise first_error
+      return "rows"
+
+    def leader():
+      try:
+        cache.get_or_execute("select * from t", "uri", execute)
+      except Exception:
+        pass
+
+    outcome = []
+
+    def follower():
+      waiting.set()
+      with deadline_scope(follower_deadline):
+        try:
+          outcome.append(cache.get_or_execute("select * from t", "uri", execute))
+        except Exception as e:
+          outcome.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    while not cache.stats()["in_flight"]:
+      time.sleep(0.001)
+    follower()
+    thread.join()
+    return outcome[0], calls
+
+  def test_follower_retries_after_leader_deadline(self):
+    cache = QueryResultCache()
+    result, calls = self.coalesce(cache, DeadlineExceeded("Deadline exceeded before the SQL query could complete"))
+    self.assertEqual(result, "rows")
+    self.assertEqual(len(calls), 2)
+    self.assertEqual(cache.stats()["retried"], 1)
+    # The retry is cached like any result
+    self.assertEqual(cache.get_or_execute("select * from t", "uri", lambda: "miss"), "rows")
+
+  @unittest.skipUnless(importlib.util.find_spec("adbc_driver_manager"), "adbc_driver_manager not installed")
+  def test_follower_retries_after_rpc_timeout(self):
+    from adbc_driver_manager import AdbcStatusCode, OperationalError
+
+    result, calls = self.coalesce(QueryResultCache(), OperationalError("rpc timed out", status_code=AdbcStatusCode.TIMEOUT))
+    self.assertEqual(result, "rows")
+    self.assertEqual(len(calls), 2)
+
+  def test_followers_share_other_errors(self):
+    error = ValueError("syntax error")
+    result, calls = self.coalesce(QueryResultCache(), error)
+    self.assertIs(result, error)
+    self.assertEqual(len(calls), 1)
+
+  def test_follower_out_of_time_does_not_retry(self):
+    result, calls = self.coalesce(QueryResultCache(), DeadlineExceeded("leader out of time"), Deadline.after(0.02))
+    self.assertIsInstance(result, DeadlineExceeded)
+    self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
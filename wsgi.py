@@ -0,0 +1,31 @@
+"""
+WSGI application of the function, the same one `python -m parliament .`
+serves, for running it under gunicorn in production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+It adds a `/metrics` endpoint with the admission control, component pool and
+prompt statistics of the worker process answering the request.
+"""
+import os
+
+from flask import jsonify
+from parliament import server
+
+from custom_components.custom_langchain_components.compiled_prompt import get_prompt_metrics
+from custom_components.runtime.admission import get_admission_controller
+from custom_components.runtime.component_pool import get_component_pool
+from custom_components.runtime.flow_plan import get_code_cache
+
+app = server.create(server.load(os.path.dirname(os.path.abspath(__file__))))
+
+
+@app.route("/metrics")
+def metrics():
+    return jsonify({
+        "pid": os.getpid(),
+        "admission": get_admission_controller().stats(),
+        "component_pool": get_component_pool().stats(),
+        "component_code": get_code_cache().stats(),
+        "prompts": get_prompt_metrics(),
+    })